@@ -2,26 +2,27 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from facets import facet_dates, facet_options, get_facets
+from query_engine import aggregate, make_spec, select_summary
+
 def filter_data(data):
     st.sidebar.title("Filters")
     st.sidebar.markdown("Select the Procedure Speciality, Surgical Priority, Date options, and Rooms:")
 
     # Select Speciality
-    specialities = sorted(data['ProcedureSpecialtyDescription'].unique().tolist())
+    facets = get_facets(data)
+    specialities = facet_options(facets, 'ProcedureSpecialtyDescription')
     all_specialities = st.sidebar.checkbox("Select all specialities", value=True)
     if all_specialities:
         selected_specialities = st.sidebar.multiselect("Select Speciality:", specialities, default=specialities)
     else:
         selected_specialities = st.sidebar.multiselect("Select Speciality:", specialities)
 
-    # Initial filter to limit options
-    if selected_specialities:
-        filtered_data = data[data['ProcedureSpecialtyDescription'].isin(selected_specialities)]
-    else:
-        filtered_data = data.copy()
+    # Limit the options below to the selected specialities
+    upstream = 'ProcedureSpecialtyDescription' if selected_specialities else None
 
     # Select Surgical Priority
-    surgical_priorities = sorted(filtered_data['SurgicalPriority'].unique().tolist())
+    surgical_priorities = facet_options(facets, 'SurgicalPriority', upstream, selected_specialities)
     all_priorities = st.sidebar.checkbox("Select all priorities", value=True)
     if all_priorities:
         selected_priorities = st.sidebar.multiselect("Select Surgical Priorities:", surgical_priorities, default=surgical_priorities)
@@ -29,10 +30,10 @@ def filter_data(data):
         selected_priorities = st.sidebar.multiselect("Select Surgical Priorities:", surgical_priorities)
 
     # Select Date Range
-    date_range = st.sidebar.date_input("Select Date Range:", [filtered_data['ScheduledDate'].min(), filtered_data['ScheduledDate'].max()])
+    date_range = st.sidebar.date_input("Select Date Range:", facet_dates(facets, 'ScheduledDate', upstream, selected_specialities))
 
     # Select Years
-    years = sorted(filtered_data['Surgery Year'].unique().tolist())
+    years = facet_options(facets, 'Surgery Year', upstream, selected_specialities)
     all_years = st.sidebar.checkbox("Select all years", value=True)
     if all_years:
         selected_years = st.sidebar.multiselect("Select Years:", years, default=years)
@@ -40,7 +41,7 @@ def filter_data(data):
         selected_years = st.sidebar.multiselect("Select Years:", years)
 
     # Select Rooms
-    rooms = sorted(filtered_data['Roomdescription'].unique().tolist())
+    rooms = facet_options(facets, 'Roomdescription', upstream, selected_specialities)
     all_rooms = st.sidebar.checkbox("Select all rooms", value=True)
     if all_rooms:
         selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms, default=rooms)
@@ -48,40 +49,37 @@ def filter_data(data):
         selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms)
 
     # Select Surgeon IDs
-    surgeon_ids = sorted(filtered_data['surgeonID'].unique().tolist())
+    surgeon_ids = facet_options(facets, 'surgeonID', upstream, selected_specialities)
     all_surgeons = st.sidebar.checkbox("Select all surgeons", value=True)
     if all_surgeons:
         selected_surgeons = st.sidebar.multiselect("Select Surgeon IDs:", surgeon_ids, default=surgeon_ids)
     else:
         selected_surgeons = st.sidebar.multiselect("Select Surgeon IDs:", surgeon_ids)
 
-    # Filter data
-    filtered_data = filtered_data[
-        (filtered_data['ProcedureSpecialtyDescription'].isin(selected_specialities if selected_specialities else specialities)) &
-        (filtered_data['surgeonID'].isin(selected_surgeons if selected_surgeons else surgeon_ids)) &
-        (filtered_data['SurgicalPriority'].isin(selected_priorities if selected_priorities else surgical_priorities)) & 
-        (filtered_data['ScheduledDate'] >= pd.to_datetime(date_range[0])) & 
-        (filtered_data['ScheduledDate'] <= pd.to_datetime(date_range[1])) & 
-        (filtered_data['Surgery Year'].isin(selected_years if selected_years else years)) & 
-        (filtered_data['Roomdescription'].isin(selected_rooms if selected_rooms else rooms)) 
-    ]
-
-    return filtered_data
+    # Filter spec, answered from the case cube or pushed down to the SQL engine
+    return make_spec('ScheduledDate', date_range, {
+        'ProcedureSpecialtyDescription': selected_specialities if selected_specialities else specialities,
+        'surgeonID': selected_surgeons if selected_surgeons else surgeon_ids,
+        'SurgicalPriority': selected_priorities if selected_priorities else surgical_priorities,
+        'Surgery Year': selected_years if selected_years else years,
+        'Roomdescription': selected_rooms if selected_rooms else rooms,
+    })
 
 def app(data):
     st.title("Demand Overview")
 
-    filtered_data = filter_data(data)
+    filtered_data = select_summary(data, filter_data(data))
 
-    full_date_range = pd.date_range(start=filtered_data['ScheduledDate'].min(), end=filtered_data['ScheduledDate'].max())
-    filtered_data_grouped = filtered_data.groupby('ScheduledDate').size().reindex(full_date_range, fill_value=0).reset_index(name='COUNT')
+    surgeries_per_date = aggregate(filtered_data, ['ScheduledDate'], {'COUNT': ('ScheduledDate', 'size')}).set_index('ScheduledDate')['COUNT']
+    full_date_range = pd.date_range(start=surgeries_per_date.index.min(), end=surgeries_per_date.index.max())
+    filtered_data_grouped = surgeries_per_date.reindex(full_date_range, fill_value=0).reset_index(name='COUNT')
     filtered_data_grouped.rename(columns={'index': 'ScheduledDate'}, inplace=True)
 
     # Add Summary Table
-    summary_table = filtered_data.groupby('ProcedureSpecialtyDescription').agg(
-        count=('ProcedureSpecialtyDescription', 'size'),
-        average_duration=('book_dur', 'mean')
-    ).reset_index()
+    summary_table = aggregate(filtered_data, ['ProcedureSpecialtyDescription'], {
+        'count': ('ProcedureSpecialtyDescription', 'size'),
+        'average_duration': ('book_dur', 'mean')
+    })
 
     st.dataframe(summary_table)
 
@@ -96,11 +94,17 @@ def app(data):
     plt.xticks(rotation=45)
     st.pyplot(fig)
 
-    # Average number of surgeries per day of the week
-    surgeries_per_day = filtered_data['DayOfWeek'].value_counts().reindex(
+    # Count and booked minutes per day of the week, computed together
+    per_day = aggregate(filtered_data, ['DayOfWeek'], {
+        'count': ('DayOfWeek', 'size'),
+        'book_dur': ('book_dur', 'sum')
+    }).set_index('DayOfWeek').reindex(
         ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     ).fillna(0)
-    weeks_count = filtered_data['ScheduledDate'].nunique() / 7
+
+    # Average number of surgeries per day of the week
+    surgeries_per_day = per_day['count']
+    weeks_count = aggregate(filtered_data, [], {'days': ('ScheduledDate', 'nunique')})['days'].iloc[0] / 7
     average_per_day_of_week = surgeries_per_day / weeks_count
 
     # Visualization
@@ -117,9 +121,7 @@ def app(data):
 
 
     st.write("### Total Duration of Surgeries per Day of the Week")
-    total_duration_per_day = filtered_data.groupby('DayOfWeek')['book_dur'].sum().reindex(
-        ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    ).fillna(0)
+    total_duration_per_day = per_day['book_dur']
 
 
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -134,7 +136,11 @@ def app(data):
 
     # Visualization
     st.write("### Count of Surgeries per Room")
-    count_per_room = filtered_data['Roomdescription'].value_counts()
+    per_room = aggregate(filtered_data, ['Roomdescription'], {
+        'count': ('Roomdescription', 'size'),
+        'book_dur': ('book_dur', 'sum')
+    }).set_index('Roomdescription')
+    count_per_room = per_room['count'].sort_values(ascending=False)
 
 
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -148,7 +154,7 @@ def app(data):
 
     st.write("### Total Booked Duration of Surgeries per Room")
 
-    duration_per_room = filtered_data.groupby('Roomdescription')['book_dur'].sum()
+    duration_per_room = per_room['book_dur']
 
     fig, ax = plt.subplots(figsize=(10, 6))
     duration_per_room.plot(kind='bar', ax=ax)
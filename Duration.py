@@ -1,40 +1,29 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
 
+from facets import facet_dates, facet_options, get_facets
+from query_engine import aggregate_many, make_spec, select_cases
+
 def filter_data(data):
-    # Parse date and time columns and handle errors
-    data['ScheduledDateTime'] = pd.to_datetime(data['ScheduledDateTime'], errors='coerce')
-    data['RoomEnterDateTime'] = pd.to_datetime(data['RoomEnterDateTime'], errors='coerce')
-    data['RoomExitDateTime'] = pd.to_datetime(data['RoomExitDateTime'], errors='coerce')
-    data = data.dropna(subset=['ScheduledDateTime', 'RoomEnterDateTime', 'RoomExitDateTime'])
-
-    # Metric calculation
-    data['EntryTimeDifference'] = data['RoomEnterDateTime'] - data['ScheduledDateTime']
-    data['ActualDuration'] = data['RoomExitDateTime'] - data['RoomEnterDateTime']
-    data['book_dur'] = pd.to_numeric(data['book_dur'], errors='coerce')
-    data['ActualDurationMinutes'] = data['ActualDuration'].dt.total_seconds() / 60
-    data['DurationDifference'] = data['ActualDurationMinutes'] - data['book_dur']
+    # Duration metrics are derived at load time, only offer options from cases with complete times
+    facets = get_facets(data, 'HasCaseTimes')
 
     st.sidebar.title("Filters")
     st.sidebar.markdown("Select the Procedure Speciality, Surgical Priority, Date options, and Rooms:")
 
     # Select Speciality
-    specialities = sorted(data['ProcedureSpecialtyDescription'].unique().tolist())
+    specialities = facet_options(facets, 'ProcedureSpecialtyDescription')
     all_specialities = st.sidebar.checkbox("Select all specialities", value=True)
     if all_specialities:
         selected_specialities = st.sidebar.multiselect("Select Speciality:", specialities, default=specialities)
     else:
         selected_specialities = st.sidebar.multiselect("Select Speciality:", specialities)
 
-    # Initial filter to limit options
-    if selected_specialities:
-        filtered_data = data[data['ProcedureSpecialtyDescription'].isin(selected_specialities)]
-    else:
-        filtered_data = data.copy()
+    # Limit the options below to the selected specialities
+    upstream = 'ProcedureSpecialtyDescription' if selected_specialities else None
 
     # Select Surgical Priority
-    surgical_priorities = sorted(filtered_data['SurgicalPriority'].unique().tolist())
+    surgical_priorities = facet_options(facets, 'SurgicalPriority', upstream, selected_specialities)
     all_priorities = st.sidebar.checkbox("Select all priorities", value=True)
     if all_priorities:
         selected_priorities = st.sidebar.multiselect("Select Surgical Priorities:", surgical_priorities, default=surgical_priorities)
@@ -42,10 +31,10 @@ def filter_data(data):
         selected_priorities = st.sidebar.multiselect("Select Surgical Priorities:", surgical_priorities)
 
     # Select Date Range
-    date_range = st.sidebar.date_input("Select Date Range:", [filtered_data['ScheduledDateTime'].min(), filtered_data['ScheduledDateTime'].max()])
+    date_range = st.sidebar.date_input("Select Date Range:", facet_dates(facets, 'ScheduledDateTime', upstream, selected_specialities))
 
     # Select Years
-    years = sorted(filtered_data['Surgery Year'].unique().tolist())
+    years = facet_options(facets, 'Surgery Year', upstream, selected_specialities)
     all_years = st.sidebar.checkbox("Select all years", value=True)
     if all_years:
         selected_years = st.sidebar.multiselect("Select Years:", years, default=years)
@@ -53,7 +42,7 @@ def filter_data(data):
         selected_years = st.sidebar.multiselect("Select Years:", years)
 
     # Select Rooms
-    rooms = sorted(filtered_data['Roomdescription'].unique().tolist())
+    rooms = facet_options(facets, 'Roomdescription', upstream, selected_specialities)
     all_rooms = st.sidebar.checkbox("Select all rooms", value=True)
     if all_rooms:
         selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms, default=rooms)
@@ -61,51 +50,57 @@ def filter_data(data):
         selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms)
 
     # Select Surgeon IDs
-    surgeon_ids = sorted(filtered_data['surgeonID'].unique().tolist())
+    surgeon_ids = facet_options(facets, 'surgeonID', upstream, selected_specialities)
     all_surgeons = st.sidebar.checkbox("Select all surgeons", value=True)
     if all_surgeons:
         selected_surgeons = st.sidebar.multiselect("Select Surgeon IDs:", surgeon_ids, default=surgeon_ids)
     else:
         selected_surgeons = st.sidebar.multiselect("Select Surgeon IDs:", surgeon_ids)
 
-    # Filter data
-    filtered_data = filtered_data[
-        (filtered_data['ProcedureSpecialtyDescription'].isin(selected_specialities if selected_specialities else specialities)) &
-        (filtered_data['surgeonID'].isin(selected_surgeons if selected_surgeons else surgeon_ids)) &
-        (filtered_data['SurgicalPriority'].isin(selected_priorities if selected_priorities else surgical_priorities)) &
-        (filtered_data['ScheduledDateTime'] >= pd.to_datetime(date_range[0])) &
-        (filtered_data['ScheduledDateTime'] <= pd.to_datetime(date_range[1])) &
-        (filtered_data['Surgery Year'].isin(selected_years if selected_years else years)) &
-        (filtered_data['Roomdescription'].isin(selected_rooms if selected_rooms else rooms))
-    ]
-
-    return filtered_data
+    # Filter spec, evaluated by pandas or pushed down to the SQL engine
+    return make_spec('ScheduledDateTime', date_range, {
+        'HasCaseTimes': [True],
+        'ProcedureSpecialtyDescription': selected_specialities if selected_specialities else specialities,
+        'surgeonID': selected_surgeons if selected_surgeons else surgeon_ids,
+        'SurgicalPriority': selected_priorities if selected_priorities else surgical_priorities,
+        'Surgery Year': selected_years if selected_years else years,
+        'Roomdescription': selected_rooms if selected_rooms else rooms,
+    })
 
 def app(data):
     st.title("Surgery Schedule Analysis")
     st.write("Duration Difference is Actual Duration - Booked Duration (schedule)")
-    filtered_data = filter_data(data)
-
-    summary_table = filtered_data.groupby('ProcedureSpecialtyDescription').agg(
-        count=('ProcedureSpecialtyDescription', 'size'),
-        average_booked_duration=('book_dur', 'mean'),
-        average_real_duration=('ActualDurationMinutes', 'mean'),
-        average_delay=('DurationDifference', 'mean')
-    ).reset_index()
+    filtered_data = select_cases(data, filter_data(data))
+
+    # Every table and chart of the page is computed in one pass
+    durations = {
+        'total_scheduled_duration': ('book_dur', 'sum'),
+        'total_actual_duration': ('ActualDurationMinutes', 'sum'),
+        'average_duration_difference': ('DurationDifference', 'mean')
+    }
+    results = aggregate_many(filtered_data, {
+        'summary': (['ProcedureSpecialtyDescription'], {
+            'count': ('ProcedureSpecialtyDescription', 'size'),
+            'average_booked_duration': ('book_dur', 'mean'),
+            'average_real_duration': ('ActualDurationMinutes', 'mean'),
+            'average_delay': ('DurationDifference', 'mean')
+        }),
+        'room': (['Roomdescription'], durations),
+        'specialty': (['ProcedureSpecialtyDescription'], durations),
+        # DayOfWeek is the day name of the scheduled date, same as ScheduledDateTime
+        'day': (['DayOfWeek'], durations),
+    })
+
+    summary_table = results['summary']
 
     st.dataframe(summary_table)
 
-    duration_by_room = filtered_data.groupby('Roomdescription').agg(
-        total_scheduled_duration=('book_dur', 'sum'),
-        total_actual_duration=('ActualDurationMinutes', 'sum')
-    ).reset_index()
+    duration_by_room = results['room']
 
      # Visualization: Duration Difference by Room
     st.write("### Duration Difference by Room")
 
-    duration_diff_by_room = filtered_data.groupby('Roomdescription').agg(
-        average_duration_difference=('DurationDifference', 'mean')
-    ).reset_index()
+    duration_diff_by_room = duration_by_room[['Roomdescription', 'average_duration_difference']]
 
     fig, ax = plt.subplots(figsize=(12, 8))
     ax.bar(duration_diff_by_room['Roomdescription'], duration_diff_by_room['average_duration_difference'], color='skyblue')
@@ -139,9 +134,8 @@ def app(data):
     # Visualization: Duration Difference by Surgical Specialty
     st.write("### Duration Difference by Surgical Specialty")
 
-    duration_diff_by_specialty = filtered_data.groupby('ProcedureSpecialtyDescription').agg(
-        average_duration_difference=('DurationDifference', 'mean')
-    ).reset_index()
+    duration_by_specialty = results['specialty']
+    duration_diff_by_specialty = duration_by_specialty[['ProcedureSpecialtyDescription', 'average_duration_difference']]
 
     fig, ax = plt.subplots(figsize=(12, 8))
     ax.bar(duration_diff_by_specialty['ProcedureSpecialtyDescription'], duration_diff_by_specialty['average_duration_difference'], color='salmon')
@@ -156,11 +150,6 @@ def app(data):
     # Scheduled vs Actual Duration by Surgical Specialty
     st.write("### Scheduled vs Actual Duration by Surgical Specialty")
 
-    duration_by_specialty = filtered_data.groupby('ProcedureSpecialtyDescription').agg(
-        total_scheduled_duration=('book_dur', 'sum'),
-        total_actual_duration=('ActualDurationMinutes', 'sum')
-    ).reset_index()
-
     fig, ax = plt.subplots(figsize=(12, 8))
     bar_width = 0.4
     index = range(len(duration_by_specialty))
@@ -180,12 +169,11 @@ def app(data):
     # Visualization: Duration Difference by Day of the Week
     st.write("### Duration Difference by Day of the Week")
 
-    duration_diff_by_day = filtered_data.groupby(filtered_data['ScheduledDateTime'].dt.day_name()).agg(
-        average_duration_difference=('DurationDifference', 'mean')
-    ).reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']).reset_index()
+    duration_by_day = results['day'].set_index('DayOfWeek').reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']).reset_index()
+    duration_diff_by_day = duration_by_day[['DayOfWeek', 'average_duration_difference']]
 
     fig, ax = plt.subplots(figsize=(12, 8))
-    ax.bar(duration_diff_by_day['ScheduledDateTime'], duration_diff_by_day['average_duration_difference'], color='lightgreen')
+    ax.bar(duration_diff_by_day['DayOfWeek'], duration_diff_by_day['average_duration_difference'], color='lightgreen')
 
     ax.set_xlabel('Day of the Week')
     ax.set_ylabel('Average Duration Difference (minutes)')
@@ -197,11 +185,6 @@ def app(data):
     # Scheduled vs Actual Duration by Day of the Week
     st.write("### Scheduled vs Actual Duration by Day of the Week")
 
-    duration_by_day = filtered_data.groupby(filtered_data['ScheduledDateTime'].dt.day_name()).agg(
-        total_scheduled_duration=('book_dur', 'sum'),
-        total_actual_duration=('ActualDurationMinutes', 'sum')
-    ).reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']).reset_index()
-
     fig, ax = plt.subplots(figsize=(12, 8))
     bar_width = 0.4
     index = range(len(duration_by_day))
@@ -213,7 +196,7 @@ def app(data):
     ax.set_ylabel('Duration (minutes)')
     ax.set_title('Scheduled vs Actual Duration by Day of the Week')
     ax.set_xticks([i + bar_width / 2 for i in index])
-    ax.set_xticklabels(duration_by_day['ScheduledDateTime'], rotation=45)
+    ax.set_xticklabels(duration_by_day['DayOfWeek'], rotation=45)
     ax.legend()
 
     st.pyplot(fig)
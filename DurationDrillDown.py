@@ -1,34 +1,26 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
 
-def filter_data(data):
-    # Data conversion
-    data['ScheduledDateTime'] = pd.to_datetime(data['ScheduledDateTime'])
-    data['RoomEnterDateTime'] = pd.to_datetime(data['RoomEnterDateTime'])
-    data['RoomExitDateTime'] = pd.to_datetime(data['RoomExitDateTime'])
-    data = data.dropna(subset=['ScheduledDateTime', 'RoomEnterDateTime', 'RoomExitDateTime'])
+from facets import facet_dates, facet_options, get_facets
+from query_engine import aggregate_many, apply_filters, make_spec
 
-    # Metric Calculation
-    data['ActualDuration'] = data['RoomExitDateTime'] - data['RoomEnterDateTime']
-    data['book_dur'] = pd.to_numeric(data['book_dur'], errors='coerce')
-    data['ActualDurationMinutes'] = data['ActualDuration'].dt.total_seconds() / 60
+def filter_data(data):
+    # Duration metrics are derived at load time, only keep cases with complete times
+    timed = {'HasCaseTimes': [True]}
 
     st.sidebar.title("Filters")
     st.sidebar.markdown("Select the Procedure Speciality, Date options, and Rooms:")
 
     # Select Speciality
-    specialities = sorted(data['ProcedureSpecialtyDescription'].unique().tolist())
+    facets = get_facets(data, 'HasCaseTimes')
+    specialities = facet_options(facets, 'ProcedureSpecialtyDescription')
     selected_speciality = st.sidebar.selectbox("Select Speciality:", specialities)
 
-    # Filter data based on selected specialty
-    filtered_data = data[data['ProcedureSpecialtyDescription'] == selected_speciality]
-
     # Select Date Range
-    date_range = st.sidebar.date_input("Select Date Range:", [filtered_data['ScheduledDateTime'].min(), filtered_data['ScheduledDateTime'].max()])
+    date_range = st.sidebar.date_input("Select Date Range:", facet_dates(facets, 'ScheduledDateTime', 'ProcedureSpecialtyDescription', [selected_speciality]))
 
     # Select Surgical Priority
-    surgical_priorities = sorted(filtered_data['SurgicalPriority'].unique().tolist())
+    surgical_priorities = facet_options(facets, 'SurgicalPriority', 'ProcedureSpecialtyDescription', [selected_speciality])
     all_priorities = st.sidebar.checkbox("Select all priorities", value=True)
     if all_priorities:
         selected_priorities = st.sidebar.multiselect("Select Surgical Priorities:", surgical_priorities, default=surgical_priorities)
@@ -36,7 +28,7 @@ def filter_data(data):
         selected_priorities = st.sidebar.multiselect("Select Surgical Priorities:", surgical_priorities)
 
     # Select Rooms
-    rooms = sorted(filtered_data['Roomdescription'].unique().tolist())
+    rooms = facet_options(facets, 'Roomdescription', 'ProcedureSpecialtyDescription', [selected_speciality])
     all_rooms = st.sidebar.checkbox("Select all rooms", value=True)
     if all_rooms:
         selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms, default=rooms)
@@ -44,7 +36,7 @@ def filter_data(data):
         selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms)
 
     # Select Surgeon IDs
-    surgeons = sorted(filtered_data['surgeonID'].unique().tolist())
+    surgeons = facet_options(facets, 'surgeonID', 'ProcedureSpecialtyDescription', [selected_speciality])
     all_surgeons = st.sidebar.checkbox("Select all surgeons", value=True)
     if all_surgeons:
         selected_surgeons = st.sidebar.multiselect("Select Surgeons:", surgeons, default=surgeons)
@@ -52,7 +44,7 @@ def filter_data(data):
         selected_surgeons = st.sidebar.multiselect("Select Surgeons:", surgeons)
 
     # Select Surgery Types
-    surgeries = sorted(filtered_data['ProcedureDescription'].unique().tolist())
+    surgeries = facet_options(facets, 'ProcedureDescription', 'ProcedureSpecialtyDescription', [selected_speciality])
     all_surgeries = st.sidebar.checkbox("Select all surgeries", value=True)
     if all_surgeries:
         selected_surgeries = st.sidebar.multiselect("Select Surgeries:", surgeries, default=surgeries)
@@ -60,14 +52,14 @@ def filter_data(data):
         selected_surgeries = st.sidebar.multiselect("Select Surgeries:", surgeries)
 
     # Filter data based on selected criteria
-    filtered_data = filtered_data[
-        (filtered_data['ScheduledDateTime'] >= pd.to_datetime(date_range[0])) &
-        (filtered_data['ScheduledDateTime'] <= pd.to_datetime(date_range[1])) &
-        (filtered_data['Roomdescription'].isin(selected_rooms if selected_rooms else rooms)) &
-        (filtered_data['SurgicalPriority'].isin(selected_priorities if selected_priorities else surgical_priorities)) &
-        (filtered_data['surgeonID'].isin(selected_surgeons if selected_surgeons else surgeons)) &
-        (filtered_data['ProcedureDescription'].isin(selected_surgeries if selected_surgeries else surgeries))
-    ]
+    filtered_data = apply_filters(data, make_spec('ScheduledDateTime', date_range, {
+        **timed,
+        'ProcedureSpecialtyDescription': [selected_speciality],
+        'Roomdescription': selected_rooms if selected_rooms else rooms,
+        'SurgicalPriority': selected_priorities if selected_priorities else surgical_priorities,
+        'surgeonID': selected_surgeons if selected_surgeons else surgeons,
+        'ProcedureDescription': selected_surgeries if selected_surgeries else surgeries,
+    }))
 
     return filtered_data
 
@@ -76,11 +68,21 @@ def app(data):
     st.subheader('Comparing Real Duration and Booked Duration')
     filtered_data = filter_data(data)
 
-    summary_table = filtered_data.groupby('ProcedureDescription').agg(
-        count=('ProcedureDescription', 'size'),
-        average_booked_duration=('book_dur', 'mean'),
-        average_real_duration=('ActualDurationMinutes', 'mean')
-    ).reset_index()
+    # Every table and chart of the page is computed in one pass
+    durations = {
+        'count': ('ProcedureDescription', 'size'),
+        'average_booked_duration': ('book_dur', 'mean'),
+        'average_real_duration': ('ActualDurationMinutes', 'mean')
+    }
+    results = aggregate_many(filtered_data, {
+        'surgery': (['ProcedureDescription'], durations),
+        'room': (['Roomdescription'], durations),
+        # DayOfWeek is the day name of the scheduled date, same as ScheduledDateTime
+        'day': (['DayOfWeek'], durations),
+        'surgeon': (['surgeonID'], durations),
+    })
+
+    summary_table = results['surgery']
 
     st.dataframe(summary_table)
 
@@ -88,11 +90,7 @@ def app(data):
     st.write("### Duration Analysis")
 
     # Duration by Room
-    duration_by_room = filtered_data.groupby('Roomdescription').agg(
-        count=('Roomdescription', 'size'),
-        average_booked_duration=('book_dur', 'mean'),
-        average_real_duration=('ActualDurationMinutes', 'mean')
-    )
+    duration_by_room = results['room'].set_index('Roomdescription')
 
     st.write("#### Duration by Room")
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -107,11 +105,7 @@ def app(data):
     st.dataframe(duration_by_room.reset_index())
 
     # Duration by Surgery
-    duration_by_surgery = filtered_data.groupby('ProcedureDescription').agg(
-        count=('ProcedureDescription', 'size'),
-        average_booked_duration=('book_dur', 'mean'),
-        average_real_duration=('ActualDurationMinutes', 'mean')
-    )
+    duration_by_surgery = results['surgery'].set_index('ProcedureDescription')
 
     st.write("#### Duration by Surgery")
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -126,11 +120,8 @@ def app(data):
     st.dataframe(duration_by_surgery.reset_index())
 
     # Duration by Day of the Week
-    duration_by_day = filtered_data.groupby(filtered_data['ScheduledDateTime'].dt.day_name()).agg(
-        count=('ScheduledDateTime', 'size'),
-        average_booked_duration=('book_dur', 'mean'),
-        average_real_duration=('ActualDurationMinutes', 'mean')
-    ).reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+    # The summary table keeps the ScheduledDateTime column name it always had
+    duration_by_day = results['day'].set_index('DayOfWeek').reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']).rename_axis('ScheduledDateTime')
 
     st.write("#### Duration by Day of the Week")
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -145,11 +136,7 @@ def app(data):
     st.dataframe(duration_by_day.reset_index())
 
     # Duration by Surgeon
-    duration_by_surgeon = filtered_data.groupby('surgeonID').agg(
-        count=('surgeonID', 'size'),
-        average_booked_duration=('book_dur', 'mean'),
-        average_real_duration=('ActualDurationMinutes', 'mean')
-    )
+    duration_by_surgeon = results['surgeon'].set_index('surgeonID')
 
     st.write("#### Duration by Surgeon")
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -1,9 +1,12 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 
+from data_loader import drop_unused_categories
+from facets import facet_options, get_facets
+from histogram import histogram_figure
+
 def filter_data(data, speciality):
-    return data[data['ProcedureSpecialtyDescription'] == speciality]
+    return drop_unused_categories(data[data['ProcedureSpecialtyDescription'] == speciality])
 
 def app(data):
     st.title("Surgery Recovery Times")
@@ -12,25 +15,21 @@ def app(data):
     st.sidebar.title("Filters")
     
     # Select Speciality
-    specialities = sorted(data['ProcedureSpecialtyDescription'].unique().tolist())
+    specialities = facet_options(get_facets(data), 'ProcedureSpecialtyDescription')
     selected_speciality = st.sidebar.selectbox("Select Speciality:", specialities)
     
     # Filter data based on selected specialty
     filtered_data = filter_data(data, selected_speciality)
 
-    # Calculate recovery times
-    filtered_data['RecoveryTime'] = pd.to_datetime(filtered_data['PacuReadyDischargeDateTime'], errors='coerce') - pd.to_datetime(filtered_data['RoomExitDateTime'], errors='coerce')
-    filtered_data['RecoveryTimeMinutes'] = filtered_data['RecoveryTime'].dt.total_seconds() / 60
-    
-    # Remove NaN values
-    filtered_data = filtered_data.dropna(subset=['RecoveryTimeMinutes'])
+    # Recovery time here runs from room exit to ready for discharge, derived at load time
+    filtered_data = filtered_data[filtered_data['HasDischargeReadyTime']]
 
     # Plot recovery times
-    fig = px.box(filtered_data, x='ProcedureDescription', y='RecoveryTimeMinutes', title=f'Recovery Times for {selected_speciality}')
+    fig = px.box(filtered_data, x='ProcedureDescription', y='DischargeReadyMinutes', labels={'DischargeReadyMinutes': 'RecoveryTimeMinutes'}, title=f'Recovery Times for {selected_speciality}')
     st.plotly_chart(fig)
 
     # Summary statistics table for each surgery
-    summary_stats = filtered_data.groupby('ProcedureDescription')['RecoveryTimeMinutes'].describe().reset_index()
+    summary_stats = filtered_data.groupby('ProcedureDescription', observed=True)['DischargeReadyMinutes'].describe().reset_index()
     summary_stats.columns = ['Procedure', 'Count', 'Mean', 'Std', 'Min', '25%', '50%', '75%', 'Max']
     st.write(f"Summary Statistics for Recovery Times in {selected_speciality}")
     st.dataframe(summary_stats)
@@ -40,12 +39,12 @@ def app(data):
     procedure_data = filtered_data[filtered_data['ProcedureDescription'] == selected_procedure]
 
     # Plot recovery times for the selected procedure
-    fig = px.histogram(procedure_data, x='RecoveryTimeMinutes', nbins=50, title=f'Recovery Times for {selected_procedure}')
+    fig = histogram_figure(procedure_data['DischargeReadyMinutes'], f'Recovery Times for {selected_procedure}', 'RecoveryTimeMinutes')
     st.plotly_chart(fig)
 
     # Display table of counts and average recovery times
-    summary_table = procedure_data.groupby('ProcedureDescription').agg(
+    summary_table = procedure_data.groupby('ProcedureDescription', observed=True).agg(
         count=('ProcedureDescription', 'size'),
-        average_recovery_time=('RecoveryTimeMinutes', 'mean')
+        average_recovery_time=('DischargeReadyMinutes', 'mean')
     ).reset_index()
     st.dataframe(summary_table)
\ No newline at end of file
@@ -1,80 +1,106 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-
-@st.cache_data
-def load_data(file_path):
-    data = pd.read_csv(file_path)
-    data['RoomEnterDateTime'] = pd.to_datetime(data['RoomEnterDateTime'], errors='coerce')
-    data['RoomExitDateTime'] = pd.to_datetime(data['RoomExitDateTime'], errors='coerce')
-    data['PacuStartdatetime'] = pd.to_datetime(data['PacuStartdatetime'], errors='coerce')
-    data['PacuEnddatetime'] = pd.to_datetime(data['PacuEnddatetime'], errors='coerce')
-    return data
-
-@st.cache_data
-def filter_data(data, start_date, end_date):
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
-    
-    filtered_data = data[
-        (data['PacuEnddatetime'] >= start_date) & 
-        (data['PacuEnddatetime'] <= end_date)
-    ]
-    return filtered_data
-
-@st.cache_data
-def calculate_counts(procedure_data, _time_range):
-    counts = []
-    for time in _time_range:
-        count = procedure_data[(procedure_data['PacuStartdatetime'] <= time) & (procedure_data['PacuEnddatetime'] >= time)].shape[0]
-        counts.append(count)
-    return pd.DataFrame({'Time': _time_range, 'Count': counts})
-
-@st.cache_data
-def calculate_max_counts_per_day(time_data):
-    time_data['Date'] = time_data['Time'].dt.date
-    max_counts_per_day = time_data.groupby('Date')['Count'].max().reset_index()
-    return max_counts_per_day
-
-@st.cache_data
-def calculate_weekly_counts(time_data):
-    time_data['Week'] = time_data['Time'].dt.to_period('W').apply(lambda r: r.start_time + pd.Timedelta(days=6))
-    weekly_counts = time_data.groupby('Week')['Count'].max().reset_index()
-    return weekly_counts
+from pandas.tseries.frequencies import to_offset
+
+from census import build_census, occupancy, period_peaks, period_time_at_or_above
+from facets import facet_dates, get_facets
+from stay_index import get_stay_index, overlapping, present_at
+
+def select_stays(data, start_date, end_date):
+    # Stays in PACU at any time from the start of the first selected day to the
+    # end of the last one, including those that started before or ended after
+    stay_index = get_stay_index(data)
+    window_end = pd.to_datetime(end_date) + pd.Timedelta(days=1)
+    return data.iloc[overlapping(stay_index, pd.to_datetime(start_date), window_end)]
+
+# Sampling interval of the census charts, peaks are exact at any resolution
+RESOLUTIONS = {'1 hour': 'h', '30 minutes': '30min', '15 minutes': '15min', '5 minutes': '5min', '1 minute': 'min'}
+
+# Most points drawn in the census chart of the whole range. A finer resolution
+# over a long range is drawn as the peak of each period of the finest
+# resolution that fits, the lookahead chart keeps the selected one.
+OVERVIEW_POINTS = 50_000
+
+def build_stays(procedure_data):
+    return build_census(procedure_data['PacuStartdatetime'], procedure_data['PacuEnddatetime'])
+
+def calculate_counts(stays, time_range):
+    # Patients in PACU at each time, read off the census step function of the stays
+    return pd.DataFrame({'Time': time_range, 'Count': occupancy(stays, time_range)})
+
+def overview_resolution(start_date, end_date, resolution):
+    span = pd.to_datetime(end_date) + pd.Timedelta(days=1) - pd.to_datetime(start_date)
+    resolutions = list(RESOLUTIONS.values())
+    for freq in reversed(resolutions[:resolutions.index(resolution) + 1]):
+        if span / pd.Timedelta(to_offset(freq)) <= OVERVIEW_POINTS:
+            return freq
+    return 'D'
+
+def calculate_period_peaks(stays, start_date, end_date, freq):
+    # Highest count in each period, so coarser periods never hide a peak
+    bounds = pd.date_range(start=pd.to_datetime(start_date), end=pd.to_datetime(end_date) + pd.Timedelta(days=1), freq=freq)
+    return pd.DataFrame({'Time': bounds[:-1], 'Count': period_peaks(stays, bounds)})
+
+def day_bounds(start_date, end_date):
+    return pd.date_range(start=pd.to_datetime(start_date), end=pd.to_datetime(end_date) + pd.Timedelta(days=1), freq='D')
+
+def calculate_max_counts_per_day(stays, start_date, end_date):
+    # True highest count of each day from the step function, not the highest sample
+    bounds = day_bounds(start_date, end_date)
+    return pd.DataFrame({'Date': bounds[:-1].date, 'Count': period_peaks(stays, bounds)})
+
+def calculate_weekly_counts(max_counts_per_day):
+    # Weeks end on Sunday, the weekly peak is the highest daily peak
+    dates = pd.to_datetime(max_counts_per_day['Date'])
+    week = (dates + pd.to_timedelta(6 - dates.dt.dayofweek, unit='D')).rename('Week')
+    return max_counts_per_day.groupby(week)['Count'].max().reset_index()
 
 def app(data):
     st.title("Surgery Recovery Times")
 
     # Select Date Range
-    date_range = st.sidebar.date_input("Select Date Range:", [data['PacuEnddatetime'].min(), data['PacuEnddatetime'].max()])
+    date_range = st.sidebar.date_input("Select Date Range:", facet_dates(get_facets(data), 'PacuEnddatetime'))
 
-    # Filter data based on selected criteria
-    filtered_data = filter_data(data, date_range[0], date_range[1])
+    # Stays overlapping the selected days, the census windows run to the end of the last day
+    selected_stays = select_stays(data, date_range[0], date_range[1])
 
-    # Calculate recovery times
-    filtered_data['RecoveryTime'] = pd.to_datetime(filtered_data['PacuEnddatetime'], errors='coerce') - pd.to_datetime(filtered_data['PacuStartdatetime'], errors='coerce')
-    filtered_data['RecoveryTimeMinutes'] = filtered_data['RecoveryTime'].dt.total_seconds() / 60
-    
-    # Remove NaN values
-    filtered_data = filtered_data.dropna(subset=['RecoveryTimeMinutes'])
+    # Recovery times are derived at load time, keep stays between 0 and 24 hours
+    procedure_data = selected_stays[selected_stays['ValidRecoveryTime']]
 
-    procedure_data = filtered_data[(filtered_data['RecoveryTimeMinutes'] < (60 * 24)) & (filtered_data['RecoveryTimeMinutes'] > 0)]
+    # Census step function of the stays, built once and read at any resolution
+    stays = build_stays(procedure_data)
+    resolution = RESOLUTIONS[st.sidebar.selectbox("Census Resolution:", list(RESOLUTIONS))]
+    render_mode = 'svg' if resolution == 'h' else 'webgl'
 
-    # Create a time range and calculate the number of patients in PACU
-    time_range = pd.date_range(start=date_range[0], end=date_range[1], freq='H')
-    time_data = calculate_counts(procedure_data, time_range)
+    # Highest number of patients in PACU per period over the whole range
+    overview = overview_resolution(date_range[0], date_range[1], resolution)
+    time_data = calculate_period_peaks(stays, date_range[0], date_range[1], overview)
 
     # Plot the number of patients in PACU over time using Plotly
-    fig = px.line(time_data, x='Time', y='Count', title='Number of Patients in PACU Over Time')
+    fig = px.line(time_data, x='Time', y='Count', title='Number of Patients in PACU Over Time', line_shape='hv', render_mode='svg' if overview in ('h', 'D') else 'webgl')
     st.plotly_chart(fig)
+    if overview != resolution:
+        period = next((label for label, freq in RESOLUTIONS.items() if freq == overview), '1 day')
+        st.caption(f"Highest count per {period} over this range, the lookahead chart below uses the selected resolution.")
 
     # Calculate and plot the highest count of patients in PACU per day
-    max_counts_per_day = calculate_max_counts_per_day(time_data)
+    max_counts_per_day = calculate_max_counts_per_day(stays, date_range[0], date_range[1])
     fig_max_counts = px.bar(max_counts_per_day, x='Date', y='Count', title='Highest Count of Patients in PACU Per Day')
     st.plotly_chart(fig_max_counts)
 
+    # Time each day with at least the threshold number of patients in PACU
+    peak = int(max_counts_per_day['Count'].max()) if len(max_counts_per_day) else 0
+    threshold = st.number_input("Occupancy Threshold (patients):", min_value=1, value=max(1, round(peak * 0.8)), step=1)
+    bounds = day_bounds(date_range[0], date_range[1])
+    hours_above = pd.DataFrame({'Date': bounds[:-1].date, 'Hours': period_time_at_or_above(stays, threshold, bounds)})
+    total_hours = hours_above['Hours'].sum()
+    st.write(f"{total_hours:,.1f} hours ({total_hours / (24 * len(hours_above)):.1%} of the range) with {threshold} or more patients in PACU")
+    fig_hours_above = px.bar(hours_above, x='Date', y='Hours', title=f'Hours Per Day with {threshold} or More Patients in PACU')
+    st.plotly_chart(fig_hours_above)
+
     # Calculate and plot the weekly counts of patients in PACU
-    weekly_counts = calculate_weekly_counts(time_data)
+    weekly_counts = calculate_weekly_counts(max_counts_per_day)
     fig_weekly_counts = px.bar(weekly_counts, x='Week', y='Count', title='Weekly Highest Count of Patients in PACU')
     st.plotly_chart(fig_weekly_counts)
 
@@ -85,13 +111,14 @@ def app(data):
     selected_start = pd.to_datetime(selected_day)
     selected_end = selected_start + pd.Timedelta(days=lookahead_days - 1)
 
-    # Filter data for the selected week
-    selected_week_data = filter_data(data, selected_start, selected_end)
-    selected_time_range = pd.date_range(start=selected_start, end=selected_end, freq='H')
-    selected_time_data = calculate_counts(selected_week_data, selected_time_range)
+    # Stays in PACU at any time in the window, including those that started before it
+    stay_index = get_stay_index(data)
+    selected_week_data = data.iloc[overlapping(stay_index, selected_start, selected_end)]
+    selected_time_range = pd.date_range(start=selected_start, end=selected_end, freq=resolution)
+    selected_time_data = calculate_counts(build_stays(selected_week_data), selected_time_range)
 
     # Plot the number of patients in PACU for the selected week
-    fig_selected_week = px.line(selected_time_data, x='Time', y='Count', title=f'Number of Patients in PACU from {selected_start.date()} to {selected_end.date()}')
+    fig_selected_week = px.line(selected_time_data, x='Time', y='Count', title=f'Number of Patients in PACU from {selected_start.date()} to {selected_end.date()}', render_mode=render_mode)
     st.plotly_chart(fig_selected_week)
 
     # Reorder columns
@@ -104,3 +131,10 @@ def app(data):
     # Display table of filtered data for the selected week
     st.write(f"Filtered Data from {selected_start.date()} to {selected_end.date()}")
     st.dataframe(selected_week_data)
+
+    # Patients in PACU at a point in time on the selected day
+    selected_time = st.time_input("Patients in PACU at:", value=pd.Timestamp('12:00').time())
+    selected_moment = pd.Timestamp.combine(selected_day, selected_time)
+    present_data = data.iloc[present_at(stay_index, selected_moment)]
+    st.write(f"{len(present_data)} patients in PACU at {selected_moment:%Y-%m-%d %H:%M}")
+    st.dataframe(present_data[cols_to_front + [col for col in present_data.columns if col not in cols_to_front]])
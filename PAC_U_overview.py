@@ -1,21 +1,16 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-import plotly.express as px
+
+from facets import facet_dates, facet_options, get_facets
+from histogram import histogram_figure
+from query_engine import apply_filters, make_spec
 
 def filter_data(data, specialities, start_date, end_date, selected_rooms):
-    # Convert dates to datetime if they are not already
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
-    
-    filtered_data = data[data['ProcedureSpecialtyDescription'].isin(specialities)]
-    filtered_data = filtered_data[
-        (filtered_data['PacuEnddatetime'] >= start_date) & 
-        (filtered_data['PacuEnddatetime'] <= end_date) &
-        (filtered_data['Roomdescription'].isin(selected_rooms))
-    ]
-    return filtered_data
+    return apply_filters(data, make_spec('PacuEnddatetime', (start_date, end_date), {
+        'ProcedureSpecialtyDescription': specialities,
+        'Roomdescription': selected_rooms,
+    }))
 
 def app(data):
     st.title("Surgery Recovery Times")
@@ -24,7 +19,7 @@ def app(data):
     st.sidebar.title("Filters")
     
     # Select Speciality
-    specialities = sorted(data['ProcedureSpecialtyDescription'].unique().tolist())
+    specialities = facet_options(get_facets(data), 'ProcedureSpecialtyDescription')
     select_all = st.sidebar.checkbox("Select All Specialties")
     
     if select_all:
@@ -33,40 +28,34 @@ def app(data):
         selected_specialities = st.sidebar.multiselect("Select Specialities:", specialities, default=specialities)
 
     # Select Date Range
-    date_range = st.sidebar.date_input("Select Date Range:", [data['PacuEnddatetime'].min(), data['PacuEnddatetime'].max()])
+    date_range = st.sidebar.date_input("Select Date Range:", facet_dates(get_facets(data), 'PacuEnddatetime'))
     
     # Select Rooms
-    rooms = sorted(data['Roomdescription'].unique().tolist())
+    rooms = facet_options(get_facets(data), 'Roomdescription')
     selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms, default=rooms)
     
     # Filter data based on selected criteria
     filtered_data = filter_data(data, selected_specialities, date_range[0], date_range[1], selected_rooms)
 
-    # Calculate recovery times
-    filtered_data['RecoveryTime'] = pd.to_datetime(filtered_data['PacuEnddatetime'], errors='coerce') - pd.to_datetime(filtered_data['PacuStartdatetime'], errors='coerce')
-    filtered_data['RecoveryTimeMinutes'] = filtered_data['RecoveryTime'].dt.total_seconds() / 60
-    
-    # Remove NaN values
-    filtered_data = filtered_data.dropna(subset=['RecoveryTimeMinutes'])
-
-    procedure_data = filtered_data[(filtered_data['RecoveryTimeMinutes'] < (60 * 24)) & (filtered_data['RecoveryTimeMinutes'] > 0)]
+    # Recovery times are derived at load time, keep stays between 0 and 24 hours
+    procedure_data = filtered_data[filtered_data['ValidRecoveryTime']]
 
     # Plot recovery times for the selected procedure
-    fig = px.histogram(procedure_data, x='RecoveryTimeMinutes', nbins=5000, title='Recovery Times')
+    fig = histogram_figure(procedure_data['RecoveryTimeMinutes'], 'Recovery Times', 'RecoveryTimeMinutes', max_bins=5000)
     st.plotly_chart(fig)
 
     # Display table of counts and average recovery times
-    summary_table = procedure_data.groupby(['ProcedureDescription', 'Roomdescription']).agg(
+    summary_table = procedure_data.groupby(['ProcedureDescription', 'Roomdescription'], observed=True).agg(
         count=('ProcedureDescription', 'size'),
         average_recovery_time=('RecoveryTimeMinutes', 'mean')
     ).reset_index()
     st.dataframe(summary_table)
 
     # Extract month and year for aggregation
-    procedure_data['Month_Year'] = procedure_data['PacuEnddatetime'].dt.to_period('M')
+    month_year = procedure_data['PacuEnddatetime'].dt.to_period('M').rename('Month_Year')
 
     # Group by Month_Year and calculate mean PACU_Duration
-    monthly_avg_duration = procedure_data.groupby('Month_Year')['RecoveryTimeMinutes'].mean().reset_index()
+    monthly_avg_duration = procedure_data.groupby(month_year)['RecoveryTimeMinutes'].mean().reset_index()
     monthly_avg_duration = monthly_avg_duration.sort_values('Month_Year')
     monthly_avg_duration['Month_Year'] = monthly_avg_duration['Month_Year'].dt.to_timestamp()
 
@@ -85,7 +74,7 @@ def app(data):
     st.pyplot(fig)
 
     # Average PACU Duration by Room
-    room_averages = procedure_data.groupby('Roomdescription')['RecoveryTimeMinutes'].mean().sort_values(ascending=False)
+    room_averages = procedure_data.groupby('Roomdescription', observed=True)['RecoveryTimeMinutes'].mean().sort_values(ascending=False)
     
     fig, ax = plt.subplots(figsize=(12, 6))
     sns.barplot(x=room_averages.index, y=room_averages.values, ax=ax)
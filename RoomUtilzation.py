@@ -1,128 +1,59 @@
+import datetime
+
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# Define Ontario civic holidays
-ontario_civic_holidays = [
-    # 2019
-    '2019-01-01',  # New Year's Day
-    '2019-02-18',  # Family Day
-    '2019-04-19',  # Good Friday
-    '2019-05-20',  # Victoria Day
-    '2019-07-01',  # Canada Day
-    '2019-08-05',  # Civic Holiday
-    '2019-09-02',  # Labour Day
-    '2019-10-14',  # Thanksgiving Day
-    '2019-12-25',  # Christmas Day
-    '2019-12-26',  # Boxing Day
-
-    # 2020
-    '2020-01-01',  # New Year's Day
-    '2020-02-17',  # Family Day
-    '2020-04-10',  # Good Friday
-    '2020-05-18',  # Victoria Day
-    '2020-07-01',  # Canada Day
-    '2020-08-03',  # Civic Holiday
-    '2020-09-07',  # Labour Day
-    '2020-10-12',  # Thanksgiving Day
-    '2020-12-25',  # Christmas Day
-    '2020-12-26',  # Boxing Day
-
-    # 2021
-    '2021-01-01',  # New Year's Day
-    '2021-02-15',  # Family Day
-    '2021-04-02',  # Good Friday
-    '2021-05-24',  # Victoria Day
-    '2021-07-01',  # Canada Day
-    '2021-08-02',  # Civic Holiday
-    '2021-09-06',  # Labour Day
-    '2021-10-11',  # Thanksgiving Day
-    '2021-12-25',  # Christmas Day
-    '2021-12-26',  # Boxing Day
-
-    # 2022
-    '2022-01-01',  # New Year's Day
-    '2022-02-21',  # Family Day
-    '2022-04-15',  # Good Friday
-    '2022-05-23',  # Victoria Day
-    '2022-07-01',  # Canada Day
-    '2022-08-01',  # Civic Holiday
-    '2022-09-05',  # Labour Day
-    '2022-10-10',  # Thanksgiving Day
-    '2022-12-25',  # Christmas Day
-    '2022-12-26',  # Boxing Day
-
-    # 2023
-    '2023-01-01',  # New Year's Day
-    '2023-02-20',  # Family Day
-    '2023-04-07',  # Good Friday
-    '2023-05-22',  # Victoria Day
-    '2023-07-01',  # Canada Day
-    '2023-08-07',  # Civic Holiday
-    '2023-09-04',  # Labour Day
-    '2023-10-09',  # Thanksgiving Day
-    '2023-12-25',  # Christmas Day
-    '2023-12-26',  # Boxing Day
-
-    # 2024
-    '2024-01-01',  # New Year's Day
-    '2024-02-19',  # Family Day
-    '2024-03-29',  # Good Friday
-    '2024-05-20',  # Victoria Day
-    '2024-07-01',  # Canada Day
-    '2024-08-05',  # Civic Holiday
-    '2024-09-02',  # Labour Day
-    '2024-10-14',  # Thanksgiving Day
-    '2024-12-25',  # Christmas Day
-    '2024-12-26',  # Boxing Day
-]
+from facets import facet_dates, facet_options, get_facets
+from ontario_calendar import available_minutes, holidays_between, working_days
+from query_engine import aggregate, make_spec, select_columns, select_summary
+from result_cache import cached_result
+from room_bitmap import BITMAP_COLUMNS, get_room_bitmap, hourly_occupancy, occupancy_heatmap
+from room_occupancy import daily_room_occupancy
 
 def filter_data(data):
     st.sidebar.title("Filters")
     st.sidebar.markdown("Select the Date options and Rooms:")
 
     # Select Date Range
-    date_range = st.sidebar.date_input("Select Date Range:", [data['ScheduledDate'].min(), data['ScheduledDate'].max()])
+    date_range = st.sidebar.date_input("Select Date Range:", facet_dates(get_facets(data), 'ScheduledDate'))
 
     # Select Rooms
-    rooms = sorted(data['Roomdescription'].unique().tolist())
+    rooms = facet_options(get_facets(data), 'Roomdescription')
     selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms, default=rooms)
 
     if st.sidebar.button("Select All Rooms"):
         selected_rooms = rooms
 
-    # Filter data
-    filtered_data = data[
-        (data['ScheduledDate'] >= pd.to_datetime(date_range[0])) & 
-        (data['ScheduledDate'] <= pd.to_datetime(date_range[1])) &
-        (data['Roomdescription'].isin(selected_rooms))
-    ]
+    # Filter spec, answered from the case cube or pushed down to the SQL engine
+    spec = make_spec('ScheduledDate', date_range, {'Roomdescription': selected_rooms})
 
-    return filtered_data, pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+    return spec, pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
 
 def app(data):
     st.title("Room Utilization")
 
     # Apply filters
-    filtered_data, start_date, end_date = filter_data(data)
-
-    # Day Calculations
-    total_days = (end_date - start_date).days + 1
+    spec, start_date, end_date = filter_data(data)
 
     remove_weekends = st.sidebar.checkbox("Remove Weekends")
     remove_civic_holidays = st.sidebar.checkbox("Remove Ontario Civic Holidays")
 
     if remove_weekends:
-        filtered_data['DayOfWeek'] = filtered_data['ScheduledDate'].dt.day_name()
-        filtered_data = filtered_data[~filtered_data['DayOfWeek'].isin(['Saturday', 'Sunday'])]
-        total_days -= len(pd.date_range(start_date, end_date, freq='W-SAT')) + len(pd.date_range(start_date, end_date, freq='W-SUN'))
+        spec['exclude']['DayOfWeek'] = ['Saturday', 'Sunday']
 
     if remove_civic_holidays:
-        filtered_data = filtered_data[~filtered_data['ScheduledDate'].isin(pd.to_datetime(ontario_civic_holidays))]
-        total_days -= sum(start_date <= pd.to_datetime(holiday) <= end_date for holiday in ontario_civic_holidays)
+        spec['exclude']['ScheduledDate'] = list(holidays_between(start_date, end_date))
+
+    filtered_data = select_summary(data, spec)
 
-    room_speciality_group = filtered_data.groupby(['Roomdescription', 'ProcedureSpecialtyDescription'])['book_dur'].sum().unstack().fillna(0)
-    total_available_minutes = total_days * 8 * 60
+    # Booked minutes per room and speciality, and per room and priority
+    room_speciality_minutes = aggregate(filtered_data, ['Roomdescription', 'ProcedureSpecialtyDescription'], {'book_dur': ('book_dur', 'sum')})
+    room_priority_minutes = aggregate(filtered_data, ['Roomdescription', 'SurgicalPriority'], {'book_dur': ('book_dur', 'sum')})
+
+    room_speciality_group = room_speciality_minutes.pivot(index='Roomdescription', columns='ProcedureSpecialtyDescription', values='book_dur').fillna(0)
+    # Minutes each room is available over the working days of the range
+    total_available_minutes = available_minutes(start_date, end_date, remove_weekends, remove_civic_holidays)
     utilization_percentage = (room_speciality_group / total_available_minutes) * 100
 
     room_total_utilization = utilization_percentage.sum(axis=1)
@@ -148,7 +79,7 @@ def app(data):
     st.write("### Room Utilization Data")
 
     # Calculate ratio of specialty usage in each room (on a scheduled minutes basis)
-    total_minutes_per_room_speciality = filtered_data.pivot_table(values='book_dur', index='Roomdescription', columns='ProcedureSpecialtyDescription', aggfunc='sum', fill_value=0)
+    total_minutes_per_room_speciality = room_speciality_group
     total_minutes_per_room = total_minutes_per_room_speciality.sum(axis=1)
     speciality_percentage_per_room = total_minutes_per_room_speciality.div(total_minutes_per_room, axis=0) * 100
 
@@ -158,7 +89,7 @@ def app(data):
     st.write("### Speciality Utilization as Percentage of Total Minutes Scheduled per Room")
     st.dataframe(speciality_percentage_per_room)
 
-    total_minutes_per_room_priority = filtered_data.pivot_table(values='book_dur', index='Roomdescription', columns='SurgicalPriority', aggfunc='sum', fill_value=0)
+    total_minutes_per_room_priority = room_priority_minutes.pivot(index='Roomdescription', columns='SurgicalPriority', values='book_dur').fillna(0)
     total_minutes_per_room = total_minutes_per_room_priority.sum(axis=1)
     priority_percentage_per_room_graph = total_minutes_per_room_priority.div(total_available_minutes, axis=0) * 100
     
@@ -184,3 +115,35 @@ def app(data):
     room_usage = room_total_utilization.mean()
     st.title(f"Total OR Utilization: {room_usage:.2f}%")
 
+    # When in the day the selected rooms are in use
+    occupancy_by_hour = hourly_occupancy(get_room_bitmap(data), spec['include']['Roomdescription'], start_date, end_date, remove_weekends, remove_civic_holidays)
+    st.pyplot(occupancy_heatmap(occupancy_by_hour, 'Room Occupancy by Hour and Weekday'))
+
+    # Actual occupancy from room enter and exit times, overlapping cases counted once
+    if st.sidebar.checkbox("Show Actual Room Occupancy"):
+        block = st.sidebar.slider("Block Window:", value=(datetime.time(8), datetime.time(16)), step=datetime.timedelta(minutes=15), format="HH:mm")
+        block_start, block_end = (time.hour * 60 + time.minute for time in block)
+
+        cases = select_columns(data, spec, BITMAP_COLUMNS)
+        daily_occupancy = cached_result(cases, ('room occupancy', block_start, block_end), lambda: daily_room_occupancy(cases, block_start, block_end))
+        room_occupancy = daily_occupancy.groupby('Roomdescription', observed=True)[
+            ['cases', 'occupied_minutes', 'block_minutes', 'overtime_minutes', 'idle_minutes']
+        ].sum()
+        block_available_minutes = working_days(start_date, end_date, remove_weekends, remove_civic_holidays) * (block_end - block_start)
+        room_occupancy['block_utilization'] = room_occupancy['block_minutes'] / block_available_minutes * 100 if block_available_minutes else 0.0
+
+        fig, ax = plt.subplots(figsize=(10, 6))
+        room_occupancy[['block_minutes', 'overtime_minutes', 'idle_minutes']].rename(columns={
+            'block_minutes': 'Occupied in block', 'overtime_minutes': 'Outside block', 'idle_minutes': 'Idle between cases'
+        }).plot(kind='bar', stacked=True, ax=ax)
+        ax.set_title('Actual Room Occupancy')
+        ax.set_xlabel('Room')
+        ax.set_ylabel('Minutes')
+        plt.xticks(rotation=45)
+        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+        ax.grid(True)
+        st.pyplot(fig)
+
+        st.write(f"### Actual Room Occupancy, block {block[0]:%H:%M} to {block[1]:%H:%M}")
+        st.dataframe(room_occupancy.style.format({'block_utilization': '{:.2f}%'}))
+
@@ -1,40 +1,95 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 
-def filter_data(data):
-    # Parse date and time columns and handle errors
-    data['ScheduledDateTime'] = pd.to_datetime(data['ScheduledDateTime'], errors='coerce')
-    data['RoomEnterDateTime'] = pd.to_datetime(data['RoomEnterDateTime'], errors='coerce')
-    data['RoomExitDateTime'] = pd.to_datetime(data['RoomExitDateTime'], errors='coerce')
-    return data
+from date_index import whole_days
+from gantt import gantt_traces, task_colors
+from query_engine import apply_filters, make_spec
+
+# Marker for each surgical priority, drawn at the middle of the case
+PRIORITY_SHAPES = {1: 'triangle-up', 2: 'diamond', 3: 'square', 4: 'circle'}
+
+# Rows of the chart per room, one per day and a gap before the next room
+ROWS_PER_ROOM = 8
+
+def weekly_gantt(weekly_data, rooms, start_date, end_date):
+    # One figure for every room and day: each room is a band of seven rows,
+    # bars are one trace per speciality and priority markers one WebGL trace
+    days = pd.date_range(start_date, end_date, freq='D').date
+    cases = weekly_data[weekly_data['Roomdescription'].isin(rooms)]
+    room_position = pd.Series(range(len(rooms)), index=rooms)
+    day_position = pd.Series(range(len(days)), index=days)
+    gantt_data = cases[['EncounterID', 'ProcedureSpecialtyDescription', 'StartHour', 'EndHour', 'surgeonID', 'SurgicalPriority']].rename(
+        columns={'ProcedureSpecialtyDescription': 'Task', 'StartHour': 'Start', 'EndHour': 'Finish'}
+    ).assign(
+        Row=room_position[cases['Roomdescription'].astype(object)].to_numpy() * ROWS_PER_ROOM + day_position[cases['DateOnly']].to_numpy()
+    )
+
+    fig = go.Figure(gantt_traces(gantt_data, 'Row', {
+        'Task': 'Task', 'Surgeon ID': 'surgeonID', 'Encounter ID': 'EncounterID',
+        'Surgical Priority': 'SurgicalPriority', 'Start': 'Start', 'Finish': 'Finish'
+    }, task_colors(gantt_data['Task'].unique())))
+
+    # Add an indicator for surgical priority
+    fig.add_trace(go.Scattergl(
+        x=((gantt_data['Start'] + gantt_data['Finish']) / 2).to_numpy(),
+        y=gantt_data['Row'].to_numpy(),
+        mode='markers',
+        marker=dict(
+            symbol=gantt_data['SurgicalPriority'].map(PRIORITY_SHAPES).fillna('circle').to_numpy(),
+            size=10,
+            color='black'
+        ),
+        showlegend=False,
+        hoverinfo='skip'
+    ))
+
+    # Shade every other room and label rows with room and day
+    for position in range(0, len(rooms), 2):
+        fig.add_hrect(y0=position * ROWS_PER_ROOM - 0.5, y1=position * ROWS_PER_ROOM + len(days) - 0.5, fillcolor='lightgrey', opacity=0.3, line_width=0, layer='below')
+    rows = [(room, position * ROWS_PER_ROOM + offset, day) for position, room in enumerate(rooms) for offset, day in enumerate(days)]
+
+    fig.update_layout(
+        title=f'Gantt Chart for Rooms from {start_date.date()} to {end_date.date()}',
+        xaxis=dict(
+            title='Time (Hours)',
+            tickmode='linear',
+            tick0=0,
+            dtick=1,
+            range=[0, 24]
+        ),
+        yaxis=dict(
+            title='Room and Date',
+            tickmode='array',
+            tickvals=[row for _, row, _ in rows],
+            ticktext=[f"{room} {day:%a %d %b}" for room, _, day in rows],
+            autorange='reversed'
+        ),
+        barmode='overlay',
+        height=150 + 18 * len(rows),
+        showlegend=True
+    )
+    return fig
 
 def app(data):
     st.title("Surgical Rooms Weekly Gantt Chart")
 
-    # Filtered data for Gantt chart
-    filtered_data = filter_data(data)
-
     # Select a week
-    unique_dates = filtered_data['ScheduledDateTime'].dt.date.unique()
-    selected_date = st.sidebar.date_input("Select Start Date of the Week", min_value=min(unique_dates), max_value=max(unique_dates))
+    selected_date = st.sidebar.date_input("Select Start Date of the Week", min_value=data['ScheduledDateTime'].min().date(), max_value=data['ScheduledDateTime'].max().date())
 
     # Get the start and end dates of the selected week
     start_date = pd.to_datetime(selected_date)
     end_date = start_date + pd.Timedelta(days=6)
 
-    # Filter data for the selected week
-    weekly_data = filtered_data[(filtered_data['ScheduledDateTime'].dt.date >= start_date.date()) & (filtered_data['ScheduledDateTime'].dt.date <= end_date.date())]
+    # The frame is sorted by schedule time, the selected week is a contiguous slice
+    weekly_data = apply_filters(data, make_spec('ScheduledDateTime', whole_days(start_date, 7), {}))
 
     if weekly_data.empty:
         st.write("No data available for the selected week.")
         return
 
-    # Convert times to hours for the Gantt chart
-    weekly_data['StartHour'] = weekly_data['RoomEnterDateTime'].dt.hour + weekly_data['RoomEnterDateTime'].dt.minute / 60
-    weekly_data['EndHour'] = weekly_data['RoomExitDateTime'].dt.hour + weekly_data['RoomExitDateTime'].dt.minute / 60
-    weekly_data['Duration'] = (weekly_data['RoomExitDateTime'] - weekly_data['RoomEnterDateTime']).dt.total_seconds() / 3600  # Duration in hours
+    # Start and end hours are derived at load time, only the duration needs converting
+    weekly_data = weekly_data.assign(Duration=weekly_data['ActualDurationMinutes'] / 60)  # Duration in hours
 
     # Prepare data for Gantt chart
     weekly_data['DayOfWeek'] = weekly_data['ScheduledDateTime'].dt.day_name()
@@ -43,73 +98,16 @@ def app(data):
     # Ensure rooms are sorted
     rooms = sorted(weekly_data['Roomdescription'].unique(), key=lambda x: (int(x.split()[1]) if x.split()[1].isdigit() else float('inf')))
 
-    for room in rooms:
-        st.write(f"### Schedule for Room: {room}")
-        room_data = weekly_data[weekly_data['Roomdescription'] == room]
-        room_data = room_data.sort_values(by='DateOnly')  # Sort days from earliest to latest
-        gantt_data = room_data[['EncounterID', 'ProcedureSpecialtyDescription', 'DayOfWeek', 'DateOnly', 'StartHour', 'EndHour', 'surgeonID', 'SurgicalPriority']]
-        gantt_data = gantt_data.rename(columns={'ProcedureSpecialtyDescription': 'Task', 'DayOfWeek': 'Resource', 'StartHour': 'Start', 'EndHour': 'Finish'})
-
-        # Create Gantt chart using Plotly
-        fig = go.Figure()
-
-        unique_tasks = gantt_data['Task'].unique()
-        colors = px.colors.qualitative.Plotly[:len(unique_tasks)]
-
-        task_color_map = {task: colors[i] for i, task in enumerate(unique_tasks)}
-
-        for i, row in gantt_data.iterrows():
-            fig.add_trace(go.Bar(
-                x=[row['Finish'] - row['Start']],
-                y=[row['DateOnly']],
-                base=row['Start'],
-                orientation='h',
-                name=row['Task'],
-                hoverinfo='text',
-                hovertext=f"Task: {row['Task']}<br>Surgeon ID: {row['surgeonID']}<br>Encounter ID: {row['EncounterID']}<br>Surgical Priority: {row['SurgicalPriority']}<br>Start: {row['Start']}<br>Finish: {row['Finish']}",
-                marker=dict(color=task_color_map[row['Task']])
-            ))
-
-            # Add an indicator for surgical priority
-            priority_shape = {
-                1: 'triangle-up',
-                2: 'diamond',
-                3: 'square',
-                4: 'circle',
-                5: None
-            }
-
-            fig.add_trace(go.Scatter(
-                x=[(row['Start'] + row['Finish']) / 2],
-                y=[row['DateOnly']],
-                mode='markers',
-                marker=dict(
-                    symbol=priority_shape.get(row['SurgicalPriority'], 'circle'),
-                    size=10,
-                    color='black'
-                ),
-                showlegend=False,
-                hoverinfo='skip'
-            ))
-
-        fig.update_layout(
-            title=f'Gantt Chart for Room {room} from {start_date.date()} to {end_date.date()}',
-            xaxis=dict(
-                title='Time (Hours)',
-                tickmode='linear',
-                tick0=0,
-                dtick=1,
-                range=[0, 24]
-            ),
-            yaxis=dict(
-                title='Date',
-                type='category'
-            ),
-            barmode='stack',
-            showlegend=True
-        )
-
-        st.plotly_chart(fig)
+    # Only the rooms in view are drawn and tabled
+    rooms_in_view = st.sidebar.multiselect("Rooms in View:", rooms, default=rooms)
+    if not rooms_in_view:
+        st.write("Select at least one room to view.")
+        return
+
+    st.plotly_chart(weekly_gantt(weekly_data, rooms_in_view, start_date, end_date))
+
+    for room in rooms_in_view:
+        room_data = weekly_data[weekly_data['Roomdescription'] == room].sort_values(by='DateOnly')
 
         # Display the schedule table for the room
         st.write(f"### Schedule Table for Room: {room}")
@@ -117,7 +115,7 @@ def app(data):
         st.dataframe(schedule_table)
 
     # Summary table showing count, sum, and average duration of surgeries in each room
-    summary = weekly_data.groupby('Roomdescription').agg(
+    summary = weekly_data.groupby('Roomdescription', observed=True).agg(
         SurgeryCount=('EncounterID', 'count'),
         TotalDuration=('Duration', 'sum'),
         AverageDuration=('Duration', 'mean')
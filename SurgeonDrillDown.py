@@ -2,19 +2,21 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from data_loader import drop_unused_categories
+from facets import facet_dates, facet_options, get_facets
+from query_engine import apply_filters, make_spec
+
 def filter_data(data):
     st.sidebar.title("Filters")
     st.sidebar.markdown("Select the SERVICE_CATEGORY, SurgicalPriority, Date options, and Rooms:")
 
     # Select Surgeon ID
-    surgeon_ids = sorted(data['surgeonID'].unique().tolist())
+    facets = get_facets(data)
+    surgeon_ids = facet_options(facets, 'surgeonID')
     selected_surgeons = st.sidebar.selectbox("Select Surgeon IDs:", surgeon_ids)
-   
-    # Filter data by selected Surgeon ID
-    filtered_data = data[data['surgeonID'] == selected_surgeons]
 
     # Select Speciality
-    specialities = sorted(filtered_data['ProcedureSpecialtyDescription'].unique().tolist())
+    specialities = facet_options(facets, 'ProcedureSpecialtyDescription', 'surgeonID', [selected_surgeons])
     all_specialities = st.sidebar.checkbox("Select all specialities", value=True)
     if all_specialities:
         specialities_category = st.sidebar.multiselect("Select Speciality:", specialities, default=specialities)
@@ -22,7 +24,7 @@ def filter_data(data):
         specialities_category = st.sidebar.multiselect("Select Speciality:", specialities)
 
     # Select Surgical Priority
-    surgical_priorities = sorted(filtered_data['SurgicalPriority'].unique().tolist())
+    surgical_priorities = facet_options(facets, 'SurgicalPriority', 'surgeonID', [selected_surgeons])
     all_priorities = st.sidebar.checkbox("Select all priorities", value=True)
     if all_priorities:
         selected_priorities = st.sidebar.multiselect("Select Surgical Priorities:", surgical_priorities, default=surgical_priorities)
@@ -30,10 +32,10 @@ def filter_data(data):
         selected_priorities = st.sidebar.multiselect("Select Surgical Priorities:", surgical_priorities)
 
     # Select Date Range
-    date_range = st.sidebar.date_input("Select Date Range:", [filtered_data['ScheduledDate'].min(), filtered_data['ScheduledDate'].max()])
+    date_range = st.sidebar.date_input("Select Date Range:", facet_dates(facets, 'ScheduledDate', 'surgeonID', [selected_surgeons]))
 
     # Select Years
-    years = sorted(filtered_data['Surgery Year'].unique().tolist())
+    years = facet_options(facets, 'Surgery Year', 'surgeonID', [selected_surgeons])
     all_years = st.sidebar.checkbox("Select all years", value=True)
     if all_years:
         selected_years = st.sidebar.multiselect("Select Years:", years, default=years)
@@ -41,7 +43,7 @@ def filter_data(data):
         selected_years = st.sidebar.multiselect("Select Years:", years)
 
     # Select Rooms
-    rooms = sorted(filtered_data['Roomdescription'].unique().tolist())
+    rooms = facet_options(facets, 'Roomdescription', 'surgeonID', [selected_surgeons])
     all_rooms = st.sidebar.checkbox("Select all rooms", value=True)
     if all_rooms:
         selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms, default=rooms)
@@ -49,19 +51,15 @@ def filter_data(data):
         selected_rooms = st.sidebar.multiselect("Select Rooms:", rooms)
 
     # Filter data
-    filtered_data = filtered_data[
-        (filtered_data['SurgicalPriority'].isin(selected_priorities)) &
-        (filtered_data['Surgery Year'].isin(selected_years)) &
-        (filtered_data['Roomdescription'].isin(selected_rooms)) &
-        (filtered_data['ProcedureSpecialtyDescription'].isin(specialities_category if not all_specialities else specialities))
-    ]
-
-    filtered_data = filtered_data[
-        (filtered_data['ScheduledDate'] >= pd.to_datetime(date_range[0])) & 
-        (filtered_data['ScheduledDate'] <= pd.to_datetime(date_range[1]))
-    ]
+    filtered_data = apply_filters(data, make_spec('ScheduledDate', date_range, {
+        'surgeonID': [selected_surgeons],
+        'SurgicalPriority': selected_priorities,
+        'Surgery Year': selected_years,
+        'Roomdescription': selected_rooms,
+        'ProcedureSpecialtyDescription': specialities_category if not all_specialities else specialities,
+    }))
 
-    return filtered_data
+    return drop_unused_categories(filtered_data)
 
 def calculate_employment_days(filtered_data):
     first_surgery_date = filtered_data['ScheduledDate'].min()
@@ -75,14 +73,16 @@ def app(data):
 
     # Calculate employment days
     employment_days = calculate_employment_days(filtered_data_surgeon)
-    filtered_data_surgeon['EmploymentDays'] = employment_days
 
     # Calculate average minutes of surgery per day of employment
     total_duration = filtered_data_surgeon['book_dur'].sum()
-    filtered_data_surgeon['AvgMinutesPerDay'] = total_duration / employment_days if employment_days > 0 else 0
+    filtered_data_surgeon = filtered_data_surgeon.assign(
+        EmploymentDays=employment_days,
+        AvgMinutesPerDay=total_duration / employment_days if employment_days > 0 else 0
+    )
 
     # Display summary table for selected Surgeon ID
-    summary_table = filtered_data_surgeon.groupby('surgeonID').agg(
+    summary_table = filtered_data_surgeon.groupby('surgeonID', observed=True).agg(
         total_surgeries=pd.NamedAgg(column='EncounterID', aggfunc='count'),
         total_duration=pd.NamedAgg(column='book_dur', aggfunc='sum'),
         average_duration=pd.NamedAgg(column='book_dur', aggfunc='mean'),
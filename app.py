@@ -1,105 +1,116 @@
-import streamlit as st
-import pandas as pd
-
-from Home import app as home_app
-from DemandOverview import app as demand_overview_app
-from SurgeonOverview import app as surgeon_overview_app
-from SurgeonDrillDown import app as surgeon_drill_down_app
-from RoomUtilzation import app as room_utlization_app
-from RoomDrillDown import app as room_drill_down_app
-from Duration import app as duration_app
-from DurationDrillDown import app as duration_drilldown_app
-from Schedule import app as schedule_app
-from ScheduleWeek import app as schedule__week_app
+import importlib
+import sys
+import time
 
-from PAC_U import app as pacu_app
-from PAC_U_overview import app as pacu_overview_app
-from PAC_U_count import app as pacu_count_app
+import streamlit as st
 
 # Load the dataset
 file_path = 'CMH-2019-04-01-2024-04-01.csv'
 file_path_2 = 'PACU_DATA.csv'
 
-@st.cache_data
-def get_data(path) -> pd.DataFrame:
-    try:
-        # Attempt to read the file from deployment path
-        data = pd.read_csv(path)
-    except Exception as e:
-        # Fallback to GitHub local path
-        data = pd.read_csv(r'C:\Users\agish\Documents\GitHub\CMH-DataSharing\CMH-2019-04-01-2024-04-01.csv')
-    return data
+@st.cache_resource
+def get_import_times():
+    # Process-wide record of how long each lazily imported module took. The first
+    # import of a module includes everything it pulls in (pandas, plotting backends).
+    return {}
 
-@st.cache_data
-def get_pacu_data(path) -> pd.DataFrame:
-    try:
-        # Attempt to read the PACU file from deployment path
-        data_pacu = pd.read_csv(path)
-    except Exception as e:
-        # Fallback to GitHub local path for the PACU file
-        data_pacu = pd.read_csv(r'C:\Users\agish\Documents\GitHub\CMH Dashboard\EDAs\PACU_DATA.csv')
-    return data_pacu
+def import_module(name):
+    # Page modules and the data layer are only imported when first needed, so the
+    # Home page never pays for pandas, matplotlib, seaborn or plotly
+    if name not in sys.modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        get_import_times()[name] = time.perf_counter() - start
+    return sys.modules[name]
 
-@st.cache_data
-def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
-    # Convert relevant columns to datetime
-    datetime_columns_main = [
-        'ScheduledDate', 'SurgeryDate', 'ScheduledDateTime', 
-        'RoomEnterDateTime', 'RoomExitDateTime'
-    ]
-    
-    for col in datetime_columns_main:
-        data[col] = pd.to_datetime(data[col], errors='coerce')
+@st.cache_resource(max_entries=1)
+def get_data(path, version=None):
+    # An ingested case store takes precedence over the raw extract. Its version is
+    # part of the cache key, so a nightly ingest is picked up without a restart.
+    if version is not None:
+        case_store = import_module('case_store')
+        data = case_store.read_store(case_store.CASE_STORE_DIR)
+        # The store keeps the case cube up to date on ingest, no need to rebuild it
+        cube = case_store.read_cube(data, case_store.CASE_STORE_DIR)
+        if cube is not None:
+            import_module('query_engine').use_cube(data, cube)
+        return data
+    # Loads the preprocessed frame from its snapshot when the CSV has not changed
+    return import_module('data_loader').load_cases(path)
 
-    # Extract date parts for 'SurgeryDate'
-    data['Surgery Year'] = data['SurgeryDate'].dt.year
-    data['Surgery Month'] = data['SurgeryDate'].dt.month
-    data['Surgery Day of The Month'] = data['SurgeryDate'].dt.day
-    data['Surgery Day of The Week'] = data['SurgeryDate'].dt.day_name()
-    data['DayOfWeek'] = data['ScheduledDate'].dt.day_name()
-    
-    return data
+@st.cache_resource
+def get_pacu_data(path):
+    return import_module('data_loader').load_pacu(path)
 
-@st.cache_data
-def preprocess_pacu_data(data_pacu: pd.DataFrame) -> pd.DataFrame:
-    datetime_columns_pacu = [
-        'RoomEnterDateTime', 'RoomExitDateTime', 'SurgeryDate', 
-        'PacuStartdatetime', 'PacuEnddatetime', 'PacuReadyDischargeDateTime', 
-        'DecisiontoTreatDatetime'
-    ]
-    
-    for col in datetime_columns_pacu:
-        data_pacu[col] = pd.to_datetime(data_pacu[col], errors='coerce')
-    
-    return data_pacu
+def get_case_data():
+    case_store = import_module('case_store')
+    return get_data(file_path, case_store.store_version(case_store.CASE_STORE_DIR))
 
-data = preprocess_data(get_data(file_path))
-data_pacu = preprocess_pacu_data(get_pacu_data(file_path_2))
+@st.cache_resource(max_entries=1)
+def get_case_source(path, version=None):
+    # DuckDB over the snapshot or store files, keyed like get_data
+    return import_module('sql_engine').open_cases(path, version)
+
+def get_summary_data():
+    # With the SQL engine the summary pages query the Arrow files directly and
+    # the pandas frame is only loaded once a page that needs it is opened
+    if not import_module('sql_engine').sql_enabled():
+        return get_case_data()
+    case_store = import_module('case_store')
+    return get_case_source(file_path, case_store.store_version(case_store.CASE_STORE_DIR))
+
+# Datasets are only loaded the first time a page that needs them is opened.
+# st.cache_resource then hands every rerun and session the same read-only frame
+# instead of a deserialized copy.
+DATASETS = {
+    'data': get_case_data,
+    'summary': get_summary_data,
+    'data_pacu': lambda: get_pacu_data(file_path_2),
+}
 
+# Each page declares its module and the dataset it is given, None for pages
+# that need no data. Modules are imported when the page is first selected.
 PAGES = {
-    "Home": home_app,
-    "Demand Overview": demand_overview_app,
-    "Surgeon Overview": surgeon_overview_app,
-    "Surgeon Drill Down": surgeon_drill_down_app,
-    "Room Usage": room_utlization_app,
-    "Room Drill Down": room_drill_down_app,
-    'Duration Analysis': duration_app,
-    "Duration Drill Down": duration_drilldown_app,
-    "Schedule": schedule_app,
-    "Weekly Schedule": schedule__week_app,
-    "Post Anasthesia Unit Overview": pacu_overview_app,
-    "Post Anasthesia Unit": pacu_app,
-    "PAC U Utlization":pacu_count_app,
-    
+    "Home": ('Home', None),
+    "Demand Overview": ('DemandOverview', 'summary'),
+    "Surgeon Overview": ('SurgeonOverview', 'summary'),
+    "Surgeon Drill Down": ('SurgeonDrillDown', 'data'),
+    "Room Usage": ('RoomUtilzation', 'summary'),
+    "Room Drill Down": ('RoomDrillDown', 'summary'),
+    'Duration Analysis': ('Duration', 'summary'),
+    "Duration Drill Down": ('DurationDrillDown', 'data'),
+    "Schedule": ('Schedule', 'data'),
+    "Weekly Schedule": ('ScheduleWeek', 'data'),
+    "Post Anasthesia Unit Overview": ('PAC_U_overview', 'data_pacu'),
+    "Post Anasthesia Unit": ('PAC_U', 'data_pacu'),
+    "PAC U Utlization": ('PAC_U_count', 'data_pacu'),
 }
 
 st.sidebar.title('Navigation')
 selection = st.sidebar.radio("Go to", list(PAGES.keys()))
 
-page = PAGES[selection]
+module_name, dataset = PAGES[selection]
+page = import_module(module_name).app
+page(DATASETS[dataset]() if dataset else None)
 
-if selection in ['Post Anasthesia Unit',"Post Anasthesia Unit Overview","PAC U Utlization"]:
-    page(data_pacu)
-else:
-    page(data)
+# Startup timing report, import cost per module in this server process
+with st.sidebar.expander("Startup timing"):
+    import_times = get_import_times()
+    if import_times:
+        st.table({
+            'Module': list(import_times),
+            'Import time (s)': [f"{seconds:.3f}" for seconds in import_times.values()],
+        })
+    else:
+        st.write("No modules imported yet.")
 
+# Shared result cache report, filtered frames reused across pages and sessions
+if 'result_cache' in sys.modules:
+    with st.sidebar.expander("Result cache"):
+        stats = sys.modules['result_cache'].result_cache_stats()
+        st.write(f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        st.write(f"{stats['entries']} results, {stats['size_mb']:.1f} of {stats['limit_mb']:.0f} MB, {stats['evictions']} evicted")
+        # Date filters that fell back to scanning the column
+        unindexed = sys.modules['result_cache'].unindexed_date_columns()
+        if unindexed:
+            st.write(f"No date index for {', '.join(unindexed)}, filters scan the column")
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+# Sidebar filter dimensions that get a bitmap index
+INDEXED_COLUMNS = [
+    'ProcedureSpecialtyDescription', 'SurgicalPriority', 'Surgery Year',
+    'Roomdescription', 'surgeonID', 'ProcedureDescription'
+]
+
+# Values matching more than 1/DENSE_RATIO of the rows are stored as packed
+# bitsets, rarer values as sorted row ids. This keeps high cardinality columns
+# like surgeons and procedures small while common values OR together quickly.
+DENSE_RATIO = 32
+
+def _codes(values: pd.Series):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return np.asarray(values.cat.codes), list(values.cat.categories)
+    codes, uniques = pd.factorize(values)
+    return codes, list(uniques)
+
+def _pack(mask) -> np.ndarray:
+    return np.packbits(mask)
+
+def _set_rows(bits, rows) -> None:
+    np.bitwise_or.at(bits, rows >> 3, (0x80 >> (rows & 7)).astype(np.uint8))
+
+def build_column_index(values: pd.Series):
+    codes, uniques = _codes(values)
+    n_rows = len(codes)
+
+    # Sorting the codes once groups the row ids of every value, in row order
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    starts = np.searchsorted(codes[order], np.arange(len(uniques)))
+
+    bitmaps = []
+    for code, count in enumerate(counts):
+        if count * DENSE_RATIO >= n_rows:
+            bitmaps.append(_pack(codes == code))
+        else:
+            bitmaps.append(order[starts[code]:starts[code] + count].astype(np.int64))
+
+    return {
+        'lookup': {value: code for code, value in enumerate(uniques)},
+        'bitmaps': bitmaps,
+        'present': counts > 0,
+        'nulls': _pack(codes < 0),
+        'has_nulls': bool((codes < 0).any()),
+    }
+
+def build_index(data: pd.DataFrame, columns=INDEXED_COLUMNS):
+    n_rows = len(data)
+    return {
+        'rows': n_rows,
+        # Padding bits after the last row are never set
+        'all': _pack(np.ones(n_rows, dtype=bool)),
+        'columns': {column: build_column_index(data[column]) for column in columns if column in data.columns},
+    }
+
+def _union(column_index, codes, n_bytes) -> np.ndarray:
+    bits = np.zeros(n_bytes, dtype=np.uint8)
+    sparse = []
+    for code in codes:
+        bitmap = column_index['bitmaps'][code]
+        if bitmap.dtype == np.uint8:
+            np.bitwise_or(bits, bitmap, out=bits)
+        else:
+            sparse.append(bitmap)
+    if sparse:
+        _set_rows(bits, np.concatenate(sparse))
+    return bits
+
+def _selection(column_index, values):
+    include_nulls = any(pd.isna(value) for value in values)
+    selected = np.zeros(len(column_index['bitmaps']), dtype=bool)
+    for value in values:
+        code = column_index['lookup'].get(value)
+        if code is not None:
+            selected[code] = True
+    unselected = np.flatnonzero(column_index['present'] & ~selected)
+    return selected, unselected, include_nulls
+
+def selects_all(index, column, values) -> bool:
+    # True when values keep every row of the column
+    column_index = index['columns'][column]
+    _, unselected, include_nulls = _selection(column_index, values)
+    return len(unselected) == 0 and (include_nulls or not column_index['has_nulls'])
+
+def column_bits(index, column, values):
+    # Bitset of the rows whose value is in values, None when every row matches
+    column_index = index['columns'][column]
+    selected, unselected, include_nulls = _selection(column_index, values)
+    if len(unselected) == 0 and (include_nulls or not column_index['has_nulls']):
+        return None
+
+    n_bytes = len(index['all'])
+    if len(unselected) < selected.sum():
+        # Large selections are cheaper as the complement of the values left out
+        bits = index['all'] & ~_union(column_index, unselected, n_bytes)
+        if not include_nulls:
+            bits &= ~column_index['nulls']
+    else:
+        bits = _union(column_index, np.flatnonzero(selected), n_bytes)
+        if include_nulls:
+            bits |= column_index['nulls']
+    return bits
+
+def select_rows(index, include):
+    # Row positions matching every indexed selection, None when nothing is restricted
+    bits = None
+    for column, values in include.items():
+        column_selection = column_bits(index, column, values)
+        if column_selection is None:
+            continue
+        bits = column_selection if bits is None else bits & column_selection
+
+    if bits is None:
+        return None
+    return np.flatnonzero(np.unpackbits(bits, count=index['rows']))
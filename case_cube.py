@@ -0,0 +1,94 @@
+import pandas as pd
+
+import parallel
+
+# Case counts and minute sums at day x room x speciality x surgeon x priority
+# grain. Surgery Year is carried along so the year filter still applies, it
+# barely adds rows since it follows from the day.
+CUBE_KEYS = [
+    'ScheduledDate', 'Roomdescription', 'ProcedureSpecialtyDescription',
+    'surgeonID', 'SurgicalPriority', 'Surgery Year'
+]
+
+# Case columns that are summed in the cube: (sum column, non-missing count column)
+CUBE_MEASURES = {
+    'book_dur': ('booked_minutes', 'booked_cases'),
+    'ActualDurationMinutes': ('actual_minutes', 'actual_cases'),
+}
+
+# Columns of the cube that filters and group keys can use
+CUBE_COLUMNS = CUBE_KEYS + ['DayOfWeek']
+
+def cube_cells(data: pd.DataFrame) -> pd.DataFrame:
+    # Every measure is a sum, so cells of parts of the case table add up to the
+    # cells of the whole table (the case store keeps its cube up to date this way)
+    cases = data[CUBE_KEYS].assign(
+        book_dur=data['book_dur'],
+        ActualDurationMinutes=data['ActualDurationMinutes'].astype('float64'),
+    )
+
+    # Missing keys are kept as their own cells so filters match the same cases
+    # as on the case table
+    return cases.groupby(CUBE_KEYS, observed=True, dropna=False).agg(
+        cases=('book_dur', 'size'),
+        booked_minutes=('book_dur', 'sum'),
+        booked_cases=('book_dur', 'count'),
+        actual_minutes=('ActualDurationMinutes', 'sum'),
+        actual_cases=('ActualDurationMinutes', 'count'),
+    ).reset_index()
+
+def finish_cube(cells: pd.DataFrame, data: pd.DataFrame) -> pd.DataFrame:
+    # Keys get the dtypes of the case table, so filters built from its facets
+    # match the cube's cells, and the cells are sorted by day first like the
+    # case table
+    cube = cells.astype({key: data[key].dtype for key in CUBE_KEYS})
+    cube = cube.sort_values(CUBE_KEYS, ignore_index=True)
+    cube['DayOfWeek'] = cube['ScheduledDate'].dt.day_name().astype('category')
+    return cube
+
+def build_cube(data: pd.DataFrame) -> pd.DataFrame:
+    return finish_cube(cube_cells(data), data)
+
+def covers(spec) -> bool:
+    # True when every column the spec filters on is a cube column
+    columns = list(spec['include']) + list(spec['exclude'])
+    if spec.get('dates'):
+        columns.append(spec['dates'][0])
+    return all(column in CUBE_COLUMNS for column in columns)
+
+def rollup(cube: pd.DataFrame, keys, measures) -> pd.DataFrame:
+    # Answers pandas named aggregations {name: (column, func)} of the case table
+    # from cube cells
+    sums = {}
+    for column, func in measures.values():
+        if func == 'size' or (func == 'count' and column == 'EncounterID'):
+            sums['cases'] = ('cases', 'sum')
+        elif column in CUBE_MEASURES and func in ('sum', 'count', 'mean'):
+            sum_column, count_column = CUBE_MEASURES[column]
+            sums[sum_column] = (sum_column, 'sum')
+            sums[count_column] = (count_column, 'sum')
+        elif column in CUBE_COLUMNS and func in ('nunique', 'min', 'max'):
+            sums[f'{column} {func}'] = (column, func)
+        else:
+            raise ValueError(f"The case cube cannot answer {func} of {column}")
+
+    if keys:
+        grouped = parallel.grouped(cube, keys, sums)
+    else:
+        grouped = pd.DataFrame({name: [cube[column].agg(func)] for name, (column, func) in sums.items()})
+
+    result = grouped[keys].copy()
+    for name, (column, func) in measures.items():
+        if func == 'size' or (func == 'count' and column == 'EncounterID'):
+            result[name] = grouped['cases']
+        elif column in CUBE_MEASURES:
+            sum_column, count_column = CUBE_MEASURES[column]
+            if func == 'sum':
+                result[name] = grouped[sum_column]
+            elif func == 'count':
+                result[name] = grouped[count_column]
+            else:
+                result[name] = grouped[sum_column] / grouped[count_column]
+        else:
+            result[name] = grouped[f'{column} {func}']
+    return result
@@ -0,0 +1,297 @@
+import json
+import os
+import uuid
+from datetime import datetime
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from case_cube import CUBE_KEYS, cube_cells, finish_cube
+from data_loader import CASE_SCHEMA, apply_schema, derive_case_metrics, preprocess_data
+from date_index import CASE_DATE_COLUMNS, sort_by_dates
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Persisted store of preprocessed cases, partitioned by 'Surgery Year'.
+# manifest.json lists the live part files, so readers never see a half
+# finished ingest and rewritten parts can be removed afterwards.
+CASE_STORE_DIR = os.environ.get('DASHBOARD_CASE_STORE', 'case_store')
+MANIFEST_FILE = 'manifest.json'
+AGGREGATE_DIR = 'aggregates'
+PARTITION_COLUMN = 'Surgery Year'
+
+# Additive aggregates kept up to date by every ingest, {name: (keys, summarise)}
+# where summarise turns cases into one row per key with summable measures.
+# Each one is keyed by ScheduledDate first so a delta only touches the rows of
+# the dates it changes, and must have a 'cases' measure that is used to drop
+# emptied rows. The dashboard reads the case cube from here instead of
+# rebuilding it from the whole store after every ingest.
+STORE_AGGREGATES = {
+    'case_cube': (CUBE_KEYS, cube_cells),
+}
+
+def store_exists(root=CASE_STORE_DIR) -> bool:
+    return os.path.exists(os.path.join(root, MANIFEST_FILE))
+
+def read_manifest(root=CASE_STORE_DIR):
+    if not store_exists(root):
+        return {'version': 0, 'parts': {}}
+    with open(os.path.join(root, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+def write_manifest(root, manifest) -> None:
+    os.makedirs(root, exist_ok=True)
+    manifest['updated'] = datetime.now().isoformat(timespec='seconds')
+    tmp_path = os.path.join(root, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(root, MANIFEST_FILE))
+
+def store_version(root=CASE_STORE_DIR):
+    # None when there is no store, so callers fall back to the raw extract
+    if not store_exists(root):
+        return None
+    return read_manifest(root)['version']
+
+def partition_name(year) -> str:
+    return 'year=unknown' if pd.isna(year) else f'year={int(year)}'
+
+def _write_frame(data: pd.DataFrame, path) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    feather.write_feather(data.reset_index(drop=True), tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+def _read_frame(path, columns=None) -> pd.DataFrame:
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+def _read_cases(path) -> pd.DataFrame:
+    # Parts ingested before the derived metrics existed are derived on read
+    data = _read_frame(path)
+    return data if 'HasCaseTimes' in data.columns else derive_case_metrics(data)
+
+def concat_frames(frames) -> pd.DataFrame:
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+
+    # Parts are written at different times and carry different category lists,
+    # union them first or pd.concat falls back to object columns
+    for col in frames[0].select_dtypes('category').columns:
+        if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames):
+            categories = union_categoricals([frame[col] for frame in frames]).categories
+            frames = [frame.assign(**{col: frame[col].cat.set_categories(categories)}) for frame in frames]
+
+    return pd.concat(frames, ignore_index=True)
+
+def read_store(root=CASE_STORE_DIR) -> pd.DataFrame:
+    manifest = read_manifest(root)
+    frames = [
+        _read_frame(os.path.join(root, part))
+        for parts in manifest['parts'].values()
+        for part in parts
+    ]
+    # Re-applying the schema settles numeric dtypes that differ between parts
+    data = apply_schema(concat_frames(frames), CASE_SCHEMA)
+
+    # Parts ingested before the derived metrics existed are derived on read
+    if 'HasCaseTimes' not in data.columns:
+        data = derive_case_metrics(data)
+
+    # Parts are sorted on their own, the combined frame is sorted once more
+    return sort_by_dates(data, CASE_DATE_COLUMNS)
+
+def read_store_tables(root=CASE_STORE_DIR):
+    # The parts as memory mapped Arrow tables, for readers that do not need
+    # pandas. None when a part still needs its derived metrics.
+    tables = [
+        feather.read_table(os.path.join(root, part), memory_map=True)
+        for parts in read_manifest(root)['parts'].values()
+        for part in parts
+    ]
+    if not tables or any('HasCaseTimes' not in table.column_names for table in tables):
+        return None
+    return tables
+
+def aggregate_path(name, root=CASE_STORE_DIR) -> str:
+    return os.path.join(root, AGGREGATE_DIR, f'{name}.arrow')
+
+def read_aggregate(name, root=CASE_STORE_DIR):
+    # None for a store written before this aggregate existed, the next ingest builds it
+    path = aggregate_path(name, root)
+    return _read_frame(path) if os.path.exists(path) else None
+
+def read_cube(data: pd.DataFrame, root=CASE_STORE_DIR):
+    # The case cube of the store's cases (data), None when the store has none yet
+    cells = read_aggregate('case_cube', root)
+    return None if cells is None else finish_cube(cells, data)
+
+def combine_aggregates(frames, keys) -> pd.DataFrame:
+    # Partial aggregates may carry different category lists, sum them on plain
+    # keys. Missing keys are cells of their own, like in the case cube.
+    combined = pd.concat(frames, ignore_index=True)
+    combined = combined.astype({
+        key: 'object' for key in keys if isinstance(combined[key].dtype, pd.CategoricalDtype)
+    })
+    return combined.groupby(keys, dropna=False).sum().reset_index()
+
+def _write_aggregate(data: pd.DataFrame, keys, path) -> None:
+    _write_frame(data.astype({key: 'category' for key in keys if data[key].dtype == object}), path)
+
+def _rebuild_aggregate(root, manifest, keys, summarise) -> pd.DataFrame:
+    cells = [
+        summarise(_read_cases(os.path.join(root, part)))
+        for parts in manifest['parts'].values() for part in parts
+    ]
+    if not cells:
+        return pd.DataFrame(columns=keys + ['cases'])
+    rebuilt = combine_aggregates(cells, keys)
+    return rebuilt[rebuilt['cases'] > 0].sort_values(keys)
+
+def check_aggregates(root=CASE_STORE_DIR) -> list:
+    # Names of the aggregates that differ from a rebuild from the parts, none
+    # when every ingest kept them up to date
+    manifest = read_manifest(root)
+    stale = []
+    for name, (keys, summarise) in STORE_AGGREGATES.items():
+        current = read_aggregate(name, root)
+        rebuilt = _rebuild_aggregate(root, manifest, keys, summarise)
+        if current is None:
+            stale.append(name)
+            continue
+        current, rebuilt = (
+            combine_aggregates([frame], keys).sort_values(keys, ignore_index=True) for frame in (current, rebuilt)
+        )
+        if not current.equals(rebuilt[current.columns]):
+            stale.append(name)
+    return stale
+
+def _update_aggregates(root, manifest, added: pd.DataFrame, removed: pd.DataFrame) -> None:
+    touched = pd.concat([added['ScheduledDate'], removed['ScheduledDate']])
+    dates = touched.dropna().unique()
+    # Cases without a ScheduledDate share the cells of the missing date
+    missing_dates = touched.isna().any()
+
+    for name, (keys, summarise) in STORE_AGGREGATES.items():
+        path = aggregate_path(name, root)
+        if not os.path.exists(path):
+            # First ingest since this aggregate was added, summarise every live part once
+            _write_aggregate(_rebuild_aggregate(root, manifest, keys, summarise), keys, path)
+            continue
+
+        current = _read_frame(path)
+
+        # Only the rows of the affected dates, the missing date included when the
+        # delta has such cases, are recombined. Everything else is kept as is.
+        affected = current['ScheduledDate'].isin(dates)
+        if missing_dates:
+            affected |= current['ScheduledDate'].isna()
+        additions = summarise(added)
+        negated = summarise(removed)
+        measures = [column for column in negated.columns if column not in keys]
+        negated[measures] = -negated[measures]
+        changed = combine_aggregates([current[affected], additions, negated], keys)
+
+        updated = combine_aggregates([current[~affected], changed[changed['cases'] > 0]], keys)
+        _write_aggregate(updated.sort_values(keys), keys, path)
+
+def _new_part_name(partition) -> str:
+    return os.path.join(partition, f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.arrow")
+
+def _write_partitions(cases: pd.DataFrame, root, manifest) -> None:
+    for year, rows in cases.groupby(cases[PARTITION_COLUMN], dropna=False):
+        partition = partition_name(year)
+        part = _new_part_name(partition)
+        _write_frame(rows, os.path.join(root, part))
+        manifest['parts'].setdefault(partition, []).append(part)
+
+def append_cases(new_cases: pd.DataFrame, root=CASE_STORE_DIR) -> dict:
+    if feather is None:
+        raise ImportError("pyarrow is required for the case store")
+
+    # A delta may list an encounter more than once, the last row wins
+    new_cases = new_cases.drop_duplicates('EncounterID', keep='last')
+    new_ids = new_cases['EncounterID']
+
+    manifest = read_manifest(root)
+    removed_frames = []
+    obsolete_parts = []
+
+    # Only parts holding an updated EncounterID are rewritten, reading just the
+    # id column is enough to find them
+    for partition, parts in manifest['parts'].items():
+        for part in list(parts):
+            path = os.path.join(root, part)
+            ids = _read_frame(path, columns=['EncounterID'])['EncounterID']
+            if not ids.isin(new_ids).any():
+                continue
+
+            existing = _read_cases(path)
+            replaced = existing['EncounterID'].isin(new_ids)
+            removed_frames.append(existing[replaced])
+            parts.remove(part)
+            obsolete_parts.append(path)
+
+            kept = existing[~replaced]
+            if not kept.empty:
+                kept_part = _new_part_name(partition)
+                _write_frame(kept, os.path.join(root, kept_part))
+                parts.append(kept_part)
+
+    # New rows go to fresh part files, existing parts are never appended to
+    _write_partitions(new_cases, root, manifest)
+
+    removed = concat_frames(removed_frames)
+    if removed.empty:
+        removed = new_cases.head(0)
+    _update_aggregates(root, manifest, new_cases, removed)
+
+    manifest['version'] += 1
+    write_manifest(root, manifest)
+    for path in obsolete_parts:
+        os.remove(path)
+
+    return {
+        'added': len(new_cases) - len(removed),
+        'updated': len(removed),
+        'version': manifest['version'],
+    }
+
+def ingest_delta(delta_path, root=CASE_STORE_DIR) -> dict:
+    # Only the delta rows are parsed and derived
+    return append_cases(preprocess_data(pd.read_csv(delta_path)), root)
+
+def build_store(csv_path, root=CASE_STORE_DIR, chunksize=100_000) -> dict:
+    if feather is None:
+        raise ImportError("pyarrow is required for the case store")
+    if store_exists(root):
+        raise FileExistsError(f"{root} already holds a case store, ingest deltas into it instead")
+
+    # Stream the extract in bounded chunks. Each chunk is preprocessed on its own
+    # and written straight to its year partitions, so peak memory depends on the
+    # chunk size rather than on the size of the extract. The extract is expected
+    # to hold one row per EncounterID, later updates go through ingest_delta.
+    manifest = read_manifest(root)
+    partials = {name: [] for name in STORE_AGGREGATES}
+    rows = 0
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        cases = preprocess_data(chunk)
+        _write_partitions(cases, root, manifest)
+        rows += len(cases)
+
+        # Aggregates are folded in after every chunk so they stay as small as their key space
+        for name, (keys, summarise) in STORE_AGGREGATES.items():
+            partials[name] = [combine_aggregates(partials[name] + [summarise(cases)], keys)]
+
+    for name, (keys, summarise) in STORE_AGGREGATES.items():
+        if partials[name]:
+            _write_aggregate(partials[name][0].sort_values(keys), keys, aggregate_path(name, root))
+
+    manifest['version'] += 1
+    write_manifest(root, manifest)
+
+    return {'added': rows, 'updated': 0, 'version': manifest['version']}
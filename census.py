@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+# PACU census as a step function. Every stay adds +1 at its start and -1 just
+# after its end (both ends count as in PACU), the events are sorted once and
+# their running sum is the number of patients from each event time onwards.
+
+def stamps(values) -> np.ndarray:
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+def build_census(starts, ends):
+    starts, ends = pd.Series(starts), pd.Series(ends)
+    # Stays without both times, or ending before they start, are never counted
+    valid = (starts.notna() & ends.notna() & (starts <= ends)).to_numpy()
+    starts = stamps(starts[valid])
+    ends = stamps(ends[valid]) + 1
+
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)])
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    levels = np.cumsum(deltas[order])
+
+    # One level per distinct time, the level after all of its events
+    last = np.append(times[1:] != times[:-1], True) if len(times) else np.zeros(0, dtype=bool)
+    return {'times': times[last], 'levels': levels[last]}
+
+def _levels_at(census, points) -> np.ndarray:
+    if len(census['times']) == 0:
+        return np.zeros(len(points), dtype=np.int64)
+    positions = np.searchsorted(census['times'], points, 'right') - 1
+    return np.where(positions >= 0, census['levels'][np.maximum(positions, 0)], 0)
+
+def occupancy(census, times) -> np.ndarray:
+    # Number of patients in PACU at each of times, a binary search per time
+    return _levels_at(census, stamps(times))
+
+def period_peaks(census, bounds) -> np.ndarray:
+    # Highest occupancy in each period [bounds[i], bounds[i + 1]), exact rather
+    # than the highest of a set of samples. Within a period the step function
+    # only changes at event times, so the peak is the level at the period start
+    # or the level after one of the events inside it.
+    peaks = occupancy(census, bounds[:-1])
+    first_event = np.searchsorted(census['times'], stamps(bounds), 'left')
+    has_events = first_event[:-1] < first_event[1:]
+    if has_events.any():
+        levels = census['levels'][:first_event[-1]]
+        peaks[has_events] = np.maximum(peaks[has_events], np.maximum.reduceat(levels, first_event[:-1][has_events]))
+    return peaks
+
+def period_time_at_or_above(census, threshold, bounds) -> np.ndarray:
+    # Time in each period [bounds[i], bounds[i + 1]) with at least threshold
+    # patients in PACU, in hours
+    edges = stamps(bounds)
+    inside = census['times'][(census['times'] > edges[0]) & (census['times'] < edges[-1])]
+    points = np.union1d(edges, inside)
+
+    # The level is constant between consecutive points
+    durations = np.diff(points) * (_levels_at(census, points[:-1]) >= threshold)
+
+    period = np.searchsorted(edges, points[:-1], 'right') - 1
+    return np.bincount(period, weights=durations, minlength=len(edges) - 1) / 3.6e12
@@ -0,0 +1,225 @@
+import glob
+import hashlib
+import os
+
+import pandas as pd
+
+from date_index import CASE_DATE_COLUMNS, PACU_DATE_COLUMNS, sort_by_dates
+
+try:
+    import pyarrow
+    import pyarrow.feather as feather
+except ImportError:
+    # Snapshots are optional, without pyarrow we always parse the CSV
+    pyarrow = feather = None
+
+# Pages only read the shared frames. Copy-on-write turns any write into a page
+# local copy instead of a change to the cached frame (always on from pandas 3).
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# Local fallbacks used when the deployment files are not present
+CMH_FALLBACK_PATH = r'C:\Users\agish\Documents\GitHub\CMH-DataSharing\CMH-2019-04-01-2024-04-01.csv'
+PACU_FALLBACK_PATH = r'C:\Users\agish\Documents\GitHub\CMH Dashboard\EDAs\PACU_DATA.csv'
+
+# Snapshots of the preprocessed frames are written next to the source file.
+# Bump SNAPSHOT_VERSION whenever preprocessing changes so old snapshots are rebuilt.
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_VERSION = 4
+SNAPSHOTS_ENABLED = os.environ.get('DASHBOARD_SNAPSHOTS', '1') != '0'
+
+# Number of bytes hashed from the head and tail of the source file
+SNAPSHOT_SAMPLE_BYTES = 1 << 20
+
+# Declared column types for the loaded frames. Low-cardinality strings are
+# dictionary encoded as categoricals and numeric parts are downcast to the
+# smallest dtype that holds them.
+CASE_SCHEMA = {
+    'category': [
+        'Roomdescription', 'ProcedureSpecialtyDescription', 'ProcedureDescription',
+        'surgeonID', 'DayOfWeek', 'Surgery Day of The Week'
+    ],
+    'numeric': [
+        'book_dur', 'SurgicalPriority', 'Surgery Year', 'Surgery Month',
+        'Surgery Day of The Month'
+    ],
+}
+
+PACU_SCHEMA = {
+    'category': [
+        'Roomdescription', 'ProcedureSpecialtyDescription', 'ProcedureDescription',
+        'surgeonID', 'SurgicalPriorityDescription', 'ProcedureMnemonic'
+    ],
+    'numeric': ['book_dur', 'SurgicalPriority'],
+}
+
+def resolve_path(path, fallback) -> str:
+    # Prefer the deployment path, otherwise fall back to the local copy
+    return path if os.path.exists(path) else fallback
+
+def downcast(values: pd.Series) -> pd.Series:
+    values = pd.to_numeric(values, errors='coerce')
+    # Integer dtypes cannot hold NaN, so columns with gaps become float32
+    if values.isna().any():
+        return pd.to_numeric(values, downcast='float')
+    return pd.to_numeric(values, downcast='integer')
+
+def apply_schema(data: pd.DataFrame, schema) -> pd.DataFrame:
+    for col in schema['category']:
+        if col in data.columns:
+            data[col] = data[col].astype('category')
+
+    for col in schema['numeric']:
+        if col in data.columns:
+            data[col] = downcast(data[col])
+
+    return data
+
+def drop_unused_categories(data: pd.DataFrame) -> pd.DataFrame:
+    # A filtered frame still carries every category of the full frame, trim them
+    # so value_counts and the charts only show values that are actually present
+    data = data.copy(deep=False)
+    for col in data.select_dtypes('category').columns:
+        data[col] = data[col].cat.remove_unused_categories()
+    return data
+
+def derive_case_metrics(data: pd.DataFrame) -> pd.DataFrame:
+    # Rows missing any of the schedule or room times are flagged rather than
+    # dropped, pages that need them filter on the flag
+    data['HasCaseTimes'] = data[['ScheduledDateTime', 'RoomEnterDateTime', 'RoomExitDateTime']].notna().all(axis=1)
+
+    data['EntryTimeDifference'] = data['RoomEnterDateTime'] - data['ScheduledDateTime']
+    data['ActualDurationMinutes'] = ((data['RoomExitDateTime'] - data['RoomEnterDateTime']).dt.total_seconds() / 60).astype('float32')
+    data['DurationDifference'] = data['ActualDurationMinutes'] - data['book_dur']
+
+    # Clock hours of room entry and exit used by the Gantt charts
+    data['StartHour'] = (data['RoomEnterDateTime'].dt.hour + data['RoomEnterDateTime'].dt.minute / 60).astype('float32')
+    data['EndHour'] = (data['RoomExitDateTime'].dt.hour + data['RoomExitDateTime'].dt.minute / 60).astype('float32')
+
+    return data
+
+def derive_pacu_metrics(data_pacu: pd.DataFrame) -> pd.DataFrame:
+    # Time spent in PACU, only stays between 0 and 24 hours are considered valid
+    data_pacu['RecoveryTimeMinutes'] = ((data_pacu['PacuEnddatetime'] - data_pacu['PacuStartdatetime']).dt.total_seconds() / 60).astype('float32')
+    data_pacu['ValidRecoveryTime'] = (data_pacu['RecoveryTimeMinutes'] > 0) & (data_pacu['RecoveryTimeMinutes'] < 60 * 24)
+
+    # Time from leaving the OR until the patient is ready for discharge
+    data_pacu['DischargeReadyMinutes'] = ((data_pacu['PacuReadyDischargeDateTime'] - data_pacu['RoomExitDateTime']).dt.total_seconds() / 60).astype('float32')
+    data_pacu['HasDischargeReadyTime'] = data_pacu['DischargeReadyMinutes'].notna()
+
+    return data_pacu
+
+def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
+    # Convert relevant columns to datetime
+    datetime_columns_main = [
+        'ScheduledDate', 'SurgeryDate', 'ScheduledDateTime',
+        'RoomEnterDateTime', 'RoomExitDateTime'
+    ]
+
+    for col in datetime_columns_main:
+        data[col] = pd.to_datetime(data[col], errors='coerce')
+
+    # Extract date parts for 'SurgeryDate'
+    data['Surgery Year'] = data['SurgeryDate'].dt.year
+    data['Surgery Month'] = data['SurgeryDate'].dt.month
+    data['Surgery Day of The Month'] = data['SurgeryDate'].dt.day
+    data['Surgery Day of The Week'] = data['SurgeryDate'].dt.day_name()
+    data['DayOfWeek'] = data['ScheduledDate'].dt.day_name()
+
+    return sort_by_dates(derive_case_metrics(apply_schema(data, CASE_SCHEMA)), CASE_DATE_COLUMNS)
+
+def preprocess_pacu_data(data_pacu: pd.DataFrame) -> pd.DataFrame:
+    datetime_columns_pacu = [
+        'RoomEnterDateTime', 'RoomExitDateTime', 'SurgeryDate',
+        'PacuStartdatetime', 'PacuEnddatetime', 'PacuReadyDischargeDateTime',
+        'DecisiontoTreatDatetime'
+    ]
+
+    for col in datetime_columns_pacu:
+        data_pacu[col] = pd.to_datetime(data_pacu[col], errors='coerce')
+
+    return sort_by_dates(derive_pacu_metrics(apply_schema(data_pacu, PACU_SCHEMA)), PACU_DATE_COLUMNS)
+
+def snapshot_key(path) -> str:
+    # Key on size and mtime, plus a hash of the head and tail of the file so a
+    # rewrite that happens to keep both is still detected
+    stat = os.stat(path)
+    digest = hashlib.sha1(f'{SNAPSHOT_VERSION}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(SNAPSHOT_SAMPLE_BYTES))
+        if stat.st_size > SNAPSHOT_SAMPLE_BYTES:
+            f.seek(-SNAPSHOT_SAMPLE_BYTES, os.SEEK_END)
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def snapshot_path(path) -> str:
+    directory = os.path.join(os.path.dirname(os.path.abspath(path)), SNAPSHOT_DIR)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(directory, f'{stem}.{snapshot_key(path)}.arrow')
+
+def read_arrow(path):
+    # The snapshot as a memory mapped Arrow table, for readers that do not need pandas
+    return feather.read_table(path, memory_map=True)
+
+def read_snapshot(path):
+    if feather is None or not os.path.exists(path):
+        return None
+    # Uncompressed Arrow IPC is memory mapped and converted straight from the
+    # mapped pages, no read buffer is allocated. The conversion still reads and
+    # copies every column, callers that need only some use read_arrow.
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+def write_snapshot(data: pd.DataFrame, path) -> None:
+    if feather is None:
+        return
+    tmp_path = path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Remove snapshots taken from older versions of the same source file
+        stem = os.path.basename(path).rsplit('.', 2)[0]
+        for old in glob.glob(os.path.join(os.path.dirname(path), f'{stem}.*.arrow')):
+            os.remove(old)
+
+        # Write to a temporary file first so a crash never leaves a half written snapshot
+        feather.write_feather(data, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+    except (OSError, pyarrow.ArrowException):
+        # A read-only deployment, or a column Arrow cannot store (mixed types
+        # left by read_csv), still works, it just parses the CSV every cold start
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_dataset(path, fallback, preprocess) -> pd.DataFrame:
+    source = resolve_path(path, fallback)
+    if not SNAPSHOTS_ENABLED or feather is None:
+        return preprocess(pd.read_csv(source))
+
+    snapshot = snapshot_path(source)
+    data = read_snapshot(snapshot)
+    if data is None:
+        data = preprocess(pd.read_csv(source))
+        write_snapshot(data, snapshot)
+    return data
+
+def load_cases(path) -> pd.DataFrame:
+    return load_dataset(path, CMH_FALLBACK_PATH, preprocess_data)
+
+def load_pacu(path) -> pd.DataFrame:
+    return load_dataset(path, PACU_FALLBACK_PATH, preprocess_pacu_data)
+
+def case_table(path):
+    # The snapshot of the case extract as a memory mapped Arrow table, taken
+    # first if there is none yet. The parsed frame itself when snapshots are
+    # off or cannot be written, so the CSV is never parsed twice.
+    source = resolve_path(path, CMH_FALLBACK_PATH)
+    if not SNAPSHOTS_ENABLED or feather is None:
+        return preprocess_data(pd.read_csv(source))
+
+    snapshot = snapshot_path(source)
+    if not os.path.exists(snapshot):
+        data = preprocess_data(pd.read_csv(source))
+        write_snapshot(data, snapshot)
+        if not os.path.exists(snapshot):
+            return data
+    return read_arrow(snapshot)
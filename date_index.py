@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+# Loaded frames are kept sorted by their primary date columns, missing dates
+# last, so a date range is a contiguous block of rows
+CASE_DATE_COLUMNS = ['ScheduledDate', 'ScheduledDateTime']
+PACU_DATE_COLUMNS = ['PacuEnddatetime']
+
+def sort_by_dates(data: pd.DataFrame, columns) -> pd.DataFrame:
+    return data.sort_values(columns, kind='stable', na_position='last', ignore_index=True)
+
+def build_date_index(values: pd.Series):
+    # The sorted timestamps of the rows that have one and their row positions,
+    # None for positions when those rows are the first ones of the frame in
+    # order. Missing values inside the sorted block (a ScheduledDateTime
+    # missing on a day that has a ScheduledDate) only leave gaps in the
+    # positions. None when the column holds no timestamps.
+    stamps = values.to_numpy()
+    if not np.issubdtype(stamps.dtype, np.datetime64):
+        return None
+
+    rows = np.flatnonzero(~np.isnat(stamps))
+    stamps = stamps[rows]
+    ordered = not (stamps[1:] < stamps[:-1]).any()
+    if not ordered:
+        order = np.argsort(stamps, kind='stable')
+        stamps, rows = stamps[order], rows[order]
+
+    contiguous = ordered and (len(rows) == 0 or rows[-1] == len(rows) - 1)
+    return {'stamps': stamps, 'rows': None if contiguous else rows, 'ordered': ordered}
+
+def date_bounds(index, start, end):
+    # Offsets [lo, hi) into the index of the dates with start <= date <= end, found by binary search
+    stamps = index['stamps']
+    start = pd.Timestamp(start).to_datetime64().astype(stamps.dtype)
+    end = pd.Timestamp(end).to_datetime64().astype(stamps.dtype)
+    return int(np.searchsorted(stamps, start, 'left')), int(np.searchsorted(stamps, end, 'right'))
+
+def date_rows(index, lo, hi):
+    # Sorted row positions of index offsets [lo, hi), None when they are the rows [lo, hi)
+    if index['rows'] is None:
+        return None
+    rows = index['rows'][lo:hi]
+    return rows if index['ordered'] else np.sort(rows)
+
+def whole_days(start, days=1):
+    # Inclusive bounds covering every timestamp of the given days
+    start = pd.Timestamp(start).normalize()
+    return start, start + pd.Timedelta(days=days) - pd.Timedelta(1, 'ns')
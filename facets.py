@@ -0,0 +1,95 @@
+import threading
+
+import pandas as pd
+
+import sql_engine
+from result_cache import frame_resource
+
+# Sidebar option lists. The distinct values of every dimension and their
+# co-occurrence with the upstream dimensions of the cascading filters are
+# computed once per loaded frame, the option lists for a selection are then
+# looked up instead of scanning and sorting the frame on every rerun.
+FACET_COLUMNS = [
+    'ProcedureSpecialtyDescription', 'SurgicalPriority', 'Surgery Year',
+    'Roomdescription', 'surgeonID', 'ProcedureDescription'
+]
+UPSTREAM_COLUMNS = ['ProcedureSpecialtyDescription', 'surgeonID']
+DATE_COLUMNS = ['ScheduledDate', 'ScheduledDateTime', 'PacuEnddatetime']
+
+# Cascaded option lists remembered per frame
+MEMO_ENTRIES = 256
+
+def build_facets(data: pd.DataFrame):
+    columns = [column for column in FACET_COLUMNS if column in data.columns]
+    dates = [column for column in DATE_COLUMNS if column in data.columns]
+
+    facets = {
+        'values': {column: sorted(data[column].dropna().unique().tolist()) for column in columns},
+        'dates': {column: (data[column].min(), data[column].max()) for column in dates},
+        'by': {},
+        'dates_by': {},
+        'memo': {},
+        'lock': threading.Lock(),
+    }
+
+    for upstream in UPSTREAM_COLUMNS:
+        if upstream not in columns:
+            continue
+        # {upstream value: {column: values seen together with it}}
+        by_value = {value: {} for value in facets['values'][upstream]}
+        for column in columns:
+            if column == upstream:
+                continue
+            pairs = data.groupby([upstream, column], observed=True).size().index
+            for value, values in pd.Series(pairs.get_level_values(1), index=pairs.get_level_values(0)).groupby(level=0, observed=True):
+                by_value[value][column] = set(values)
+        facets['by'][upstream] = by_value
+
+        # Earliest and latest date per upstream value
+        if dates:
+            facets['dates_by'][upstream] = data.groupby(upstream, observed=True)[dates].agg(['min', 'max'])
+    return facets
+
+def get_facets(data, flag=None):
+    # Built once per loaded frame. flag names a boolean column, the facets then
+    # describe only the rows where it is set. The SQL engine hands over its
+    # distinct combinations instead of the cases.
+    if sql_engine.is_source(data):
+        build = lambda: build_facets(sql_engine.facet_frame(data, FACET_COLUMNS, DATE_COLUMNS, flag))
+    else:
+        build = lambda: build_facets(data[data[flag]] if flag else data)
+    return frame_resource(data, ('facets', flag), build)
+
+def _memo(facets, key, compute):
+    # The facets are shared by every session, the memo is only touched under its lock
+    with facets['lock']:
+        memo = facets['memo']
+        if key not in memo:
+            if len(memo) >= MEMO_ENTRIES:
+                memo.clear()
+            memo[key] = compute()
+        return memo[key]
+
+def facet_options(facets, column, upstream=None, selected=None):
+    # Sorted values of column, limited to rows matching the upstream selection
+    # when one is given. An empty selection matches nothing.
+    if upstream is None:
+        return list(facets['values'][column])
+
+    def compute():
+        seen = set()
+        for value in selected:
+            seen |= facets['by'][upstream].get(value, {}).get(column, set())
+        return sorted(seen)
+    return list(_memo(facets, ('options', column, upstream, frozenset(selected)), compute))
+
+def facet_dates(facets, column, upstream=None, selected=None):
+    # [earliest, latest] date, NaT for an empty selection like min/max of an empty frame
+    if upstream is None:
+        return list(facets['dates'][column])
+
+    def compute():
+        bounds = facets['dates_by'][upstream][column]
+        bounds = bounds[bounds.index.isin(list(selected))]
+        return bounds['min'].min(), bounds['max'].max()
+    return list(_memo(facets, ('dates', column, upstream, frozenset(selected)), compute))
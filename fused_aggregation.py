@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# Measures that decompose into per-group sizes, sums and non-missing counts
+FUSED_FUNCS = ('size', 'sum', 'count', 'mean')
+
+# Largest dense table of key combinations that is rolled up in memory
+MAX_DENSE_CELLS = 1 << 22
+
+def encode(values: pd.Series):
+    # Integer codes in sort order with missing values as one extra last code,
+    # and a function turning codes back into a key column
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories
+        codes = np.asarray(values.cat.codes, dtype=np.int64)
+        decode = lambda taken: pd.Categorical.from_codes(taken, dtype=values.dtype)
+    else:
+        codes, categories = pd.factorize(values, sort=True)
+        codes = codes.astype(np.int64)
+        decode = categories.take
+    size = len(categories)
+    return np.where(codes < 0, size, codes), size + 1, decode
+
+def measure_partials(cases: pd.DataFrame, column):
+    values = cases[column].to_numpy(dtype='float64', na_value=np.nan)
+    valid = ~np.isnan(values)
+    return np.where(valid, values, 0.0), valid.astype(np.float64)
+
+def plan(requests, cardinality):
+    # One root at the grain of all keys when its dense table is small enough,
+    # every request is then rolled up from a single pass over the rows.
+    # Otherwise requests with the most keys become roots and a request whose
+    # keys are a subset of a root's keys is rolled up from that root.
+    union = []
+    for keys, _ in requests.values():
+        union += [key for key in keys if key not in union]
+    if np.prod([cardinality[key] for key in union], dtype=np.float64) <= MAX_DENSE_CELLS:
+        return [{'keys': union, 'members': list(requests)}]
+
+    roots = []
+    for name in sorted(requests, key=lambda name: -len(requests[name][0])):
+        keys, _ = requests[name]
+        root = next((root for root in roots if set(keys) <= set(root['keys'])), None)
+        if root is None:
+            root = {'keys': list(keys), 'members': []}
+            roots.append(root)
+        root['members'].append(name)
+    return roots
+
+def aggregate_many(cases: pd.DataFrame, requests):
+    # requests {name: (keys, measures)} with measures in the pandas named
+    # aggregation form. Returns {name: frame} for the requests that were fused,
+    # the caller computes the others one by one.
+    fusable = {
+        name: (keys, measures) for name, (keys, measures) in requests.items()
+        if keys and all(func in FUSED_FUNCS for _, func in measures.values())
+    }
+
+    if not fusable:
+        return {}
+
+    # Key encodings and measure partials are shared by every request
+    encodings = {key: encode(cases[key]) for keys, _ in fusable.values() for key in keys}
+    cardinality = {key: encoding[1] for key, encoding in encodings.items()}
+    partials, results = {}, {}
+
+    for root in plan(fusable, cardinality):
+        shape = tuple(cardinality[key] for key in root['keys'])
+        if np.prod(shape, dtype=np.float64) > MAX_DENSE_CELLS:
+            continue
+
+        columns = {
+            column for name in root['members']
+            for column, func in fusable[name][1].values() if func != 'size'
+        }
+        for column in columns:
+            if column not in partials:
+                partials[column] = measure_partials(cases, column)
+
+        # One pass over the rows per partial at the root's grain
+        cells = np.ravel_multi_index([encodings[key][0] for key in root['keys']], shape)
+        size = int(np.prod(shape))
+        table = {'size': np.bincount(cells, minlength=size).reshape(shape)}
+        for column in columns:
+            filled, valid = partials[column]
+            table[(column, 'sum')] = np.bincount(cells, weights=filled, minlength=size).reshape(shape)
+            table[(column, 'count')] = np.bincount(cells, weights=valid, minlength=size).reshape(shape)
+
+        for name in root['members']:
+            keys, measures = fusable[name]
+            results[name] = rollup(cases, root['keys'], table, keys, measures, encodings)
+    return results
+
+def rollup(cases, root_keys, table, keys, measures, encodings) -> pd.DataFrame:
+    # Sums the root table over the keys this request does not group by
+    axes = tuple(axis for axis, key in enumerate(root_keys) if key not in keys)
+    order = [[key for key in root_keys if key in keys].index(key) for key in keys]
+    reduce = lambda cells: cells.sum(axis=axes).transpose(order) if axes else cells.transpose(order)
+
+    # Groups that have rows and no missing key, in sort order like groupby
+    size = reduce(table['size'])
+    observed = size > 0
+    for axis, key in enumerate(keys):
+        missing = [slice(None)] * len(keys)
+        missing[axis] = -1
+        observed[tuple(missing)] = False
+    positions = np.nonzero(observed)
+
+    result = pd.DataFrame({key: encodings[key][2](positions[axis]) for axis, key in enumerate(keys)})
+    for name, (column, func) in measures.items():
+        if func == 'size':
+            result[name] = size[positions].astype(np.int64)
+            continue
+        sums = reduce(table[(column, 'sum')])[positions]
+        counts = reduce(table[(column, 'count')])[positions]
+        if func == 'sum':
+            integer = pd.api.types.is_integer_dtype(cases[column].dtype) or pd.api.types.is_bool_dtype(cases[column].dtype)
+            result[name] = sums.astype(np.int64) if integer else sums
+        elif func == 'count':
+            result[name] = counts.astype(np.int64)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[name] = sums / counts
+    return result
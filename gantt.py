@@ -0,0 +1,44 @@
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Gantt bars built column-wise, one trace per task (speciality) whatever the
+# number of cases, so the figure's size and the number of legend entries stay
+# flat as a day gets busier.
+
+def task_colors(tasks):
+    palette = px.colors.qualitative.Plotly
+    return {task: palette[i % len(palette)] for i, task in enumerate(tasks)}
+
+def hover_text(gantt_data, fields) -> np.ndarray:
+    # fields {label: column}, one "label: value" line per field
+    lines = [label + ': ' + gantt_data[column].astype(str) for label, column in fields.items()]
+    text = lines[0]
+    for line in lines[1:]:
+        text = text + '<br>' + line
+    return text.to_numpy()
+
+def gantt_traces(gantt_data, y, hover_fields, colors, showlegend=True):
+    # Horizontal bars from Start to Finish (hours) on the y column, one trace
+    # per Task. Traces of the same task share a legend group, so figures with
+    # several panels can show each task once.
+    start = gantt_data['Start'].to_numpy()
+    width = gantt_data['Finish'].to_numpy() - start
+    y = gantt_data[y].to_numpy()
+    hover = hover_text(gantt_data, hover_fields)
+
+    traces = []
+    for task, rows in gantt_data.groupby('Task', observed=True, sort=False).indices.items():
+        traces.append(go.Bar(
+            x=width[rows],
+            y=y[rows],
+            base=start[rows],
+            orientation='h',
+            name=str(task),
+            legendgroup=str(task),
+            showlegend=showlegend,
+            hoverinfo='text',
+            hovertext=hover[rows],
+            marker=dict(color=colors[task]),
+        ))
+    return traces
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Histograms are binned here with NumPy and only the bins are sent to the
+# browser, so the chart's size does not grow with the number of rows.
+
+def bin_edges(values: np.ndarray, max_bins=50) -> np.ndarray:
+    # Freedman-Diaconis bin width, which follows the spread of the data and is
+    # robust to outliers, capped at max_bins. Whole-number data such as
+    # minutes gets whole-number widths so no bin straddles a value.
+    if len(values) == 0:
+        return np.array([0.0, 1.0])
+    low, high = values.min(), values.max()
+    if low == high:
+        return np.array([low - 0.5, high + 0.5])
+
+    q1, q3 = np.percentile(values, [25, 75])
+    width = 2 * (q3 - q1) / len(values) ** (1 / 3)
+    width = max(width, (high - low) / max_bins)
+    if np.all(values == np.round(values)):
+        width = max(1.0, np.ceil(width))
+        low = np.floor(low)
+    count = max(1, int(np.ceil((high - low) / width)))
+    edges = low + width * np.arange(count + 1)
+    edges[-1] = max(edges[-1], high)
+    return edges
+
+def histogram(values, max_bins=50) -> pd.DataFrame:
+    # Counts per bin [start, end), the last bin includes its end
+    values = pd.Series(values).to_numpy(dtype='float64', na_value=np.nan)
+    values = values[~np.isnan(values)]
+    edges = bin_edges(values, max_bins)
+    counts, edges = np.histogram(values, bins=edges)
+    return pd.DataFrame({'start': edges[:-1], 'end': edges[1:], 'count': counts})
+
+def histogram_figure(values, title, x_label, max_bins=50) -> go.Figure:
+    bins = histogram(values, max_bins)
+    fig = go.Figure(go.Bar(
+        x=(bins['start'] + bins['end']) / 2,
+        y=bins['count'],
+        width=bins['end'] - bins['start'],
+        customdata=bins[['start', 'end']],
+        hovertemplate=f'{x_label}: %{{customdata[0]:g}} to %{{customdata[1]:g}}<br>count: %{{y}}<extra></extra>',
+    ))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title='count', bargap=0)
+    return fig
@@ -0,0 +1,33 @@
+import argparse
+
+from case_store import CASE_STORE_DIR, build_store, check_aggregates, ingest_delta, store_exists
+
+# Merge CMH extracts into the persisted case store:
+#   python ingest.py CMH-2019-04-01-2024-04-01.csv   (first run builds the store)
+#   python ingest.py CMH-delta-2024-04-02.csv        (nightly delta)
+# The first extract is streamed in chunks of --chunksize rows so it never has to
+# fit in memory. Rows whose EncounterID is already stored replace the old rows.
+# --check compares the maintained aggregates with a rebuild from the stored cases.
+def main():
+    parser = argparse.ArgumentParser(description="Ingest CMH extracts into the case store")
+    parser.add_argument('files', nargs='*', help="CSV extracts or daily delta files")
+    parser.add_argument('--store', default=CASE_STORE_DIR, help="case store directory")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="rows per chunk when building a new store")
+    parser.add_argument('--check', action='store_true', help="check the aggregates against a full rebuild afterwards")
+    args = parser.parse_args()
+
+    for path in args.files:
+        if store_exists(args.store):
+            result = ingest_delta(path, args.store)
+        else:
+            result = build_store(path, args.store, args.chunksize)
+        print(f"{path}: {result['added']} added, {result['updated']} updated (store version {result['version']})")
+
+    if args.check:
+        stale = check_aggregates(args.store)
+        print(f"Aggregates out of date: {', '.join(stale)}" if stale else "Aggregates match the stored cases")
+        if stale:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
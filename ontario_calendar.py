@@ -0,0 +1,96 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Ontario holidays generated from their rules, and business-day masks and
+# counts over them with NumPy's business-day functions.
+
+# Years the holiday array covers, built once at import. Dates outside them
+# raise rather than silently count as having no holidays.
+HOLIDAY_YEARS = range(1990, 2101)
+
+# Minutes a room is available on a working day
+WORKDAY_MINUTES = 8 * 60
+
+def easter(year) -> datetime.date:
+    # Gregorian Easter Sunday (anonymous Gregorian algorithm)
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+def _nth_monday(year, month, n) -> datetime.date:
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(7 - first.weekday()) % 7 + 7 * (n - 1))
+
+def ontario_holidays(year):
+    # {date: name}, each holiday on its own date rather than an observed weekday
+    may_24 = datetime.date(year, 5, 24)
+    holidays = {
+        datetime.date(year, 1, 1): "New Year's Day",
+        easter(year) - datetime.timedelta(days=2): 'Good Friday',
+        may_24 - datetime.timedelta(days=may_24.weekday()): 'Victoria Day',
+        datetime.date(year, 7, 1): 'Canada Day',
+        _nth_monday(year, 8, 1): 'Civic Holiday',
+        _nth_monday(year, 9, 1): 'Labour Day',
+        _nth_monday(year, 10, 2): 'Thanksgiving Day',
+        datetime.date(year, 12, 25): 'Christmas Day',
+        datetime.date(year, 12, 26): 'Boxing Day',
+    }
+    # Family Day is a statutory holiday since 2008
+    if year >= 2008:
+        holidays[_nth_monday(year, 2, 3)] = 'Family Day'
+    return holidays
+
+HOLIDAYS = np.array(sorted(day for year in HOLIDAY_YEARS for day in ontario_holidays(year)), dtype='datetime64[D]')
+
+def _days(value) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+# Business-day calendars by (remove weekends, remove holidays)
+CALENDARS = {
+    (weekends, holidays): np.busdaycalendar(
+        weekmask='1111100' if weekends else '1111111',
+        holidays=HOLIDAYS if holidays else [],
+    )
+    for weekends in (False, True) for holidays in (False, True)
+}
+
+def _calendar(remove_weekends, remove_holidays):
+    return CALENDARS[bool(remove_weekends), bool(remove_holidays)]
+
+def _check_years(start, end) -> None:
+    if start.year < HOLIDAY_YEARS[0] or end.year > HOLIDAY_YEARS[-1]:
+        raise ValueError(f"Ontario holidays are only known for {HOLIDAY_YEARS[0]} to {HOLIDAY_YEARS[-1]}, not {start} to {end}")
+
+def holidays_between(start, end) -> pd.DatetimeIndex:
+    # Holidays from start to end, both included
+    _check_years(pd.Timestamp(start), pd.Timestamp(end))
+    lo = np.searchsorted(HOLIDAYS, _days(start), 'left')
+    hi = np.searchsorted(HOLIDAYS, _days(end), 'right')
+    return pd.DatetimeIndex(HOLIDAYS[lo:hi].astype('datetime64[ns]'))
+
+def working_days(start, end, remove_weekends=False, remove_holidays=False) -> int:
+    # Days from start to end, both included, that are not removed. A holiday
+    # on a weekend is only removed once.
+    if remove_holidays:
+        _check_years(pd.Timestamp(start), pd.Timestamp(end))
+    return int(np.busday_count(_days(start), _days(end) + 1, busdaycal=_calendar(remove_weekends, remove_holidays)))
+
+def working_day_mask(dates, remove_weekends=False, remove_holidays=False) -> np.ndarray:
+    # True for each of dates that is a working day
+    dates = pd.to_datetime(dates)
+    if remove_holidays and len(dates):
+        _check_years(dates.min(), dates.max())
+    days = dates.to_numpy(dtype='datetime64[D]')
+    return np.is_busday(days, busdaycal=_calendar(remove_weekends, remove_holidays))
+
+def available_minutes(start, end, remove_weekends=False, remove_holidays=False, rooms=1) -> int:
+    # Room minutes available from start to end for rooms rooms
+    return working_days(start, end, remove_weekends, remove_holidays) * WORKDAY_MINUTES * rooms
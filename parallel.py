@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Large group-bys are split into contiguous row ranges, which are date ranges
+# since loaded frames are sorted by date, and aggregated on a thread pool. The
+# group-by kernels of pandas release the GIL, so the partitions run on all cores.
+# Set DASHBOARD_WORKERS=1 to always aggregate on one thread.
+WORKERS = int(os.environ.get('DASHBOARD_WORKERS', os.cpu_count() or 1))
+
+# Smaller frames are aggregated directly, splitting them costs more than it saves
+MIN_PARTITION_ROWS = 100_000
+
+# How partial results of each function are merged, mean is a sum and a count
+MERGE = {'size': 'sum', 'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+@st.cache_resource
+def get_pool():
+    return ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='aggregate')
+
+def plan_partials(measures):
+    # Partial aggregates {partial: (column, func)} per partition, None when a
+    # measure does not merge across partitions (nunique)
+    partials = {}
+    for name, (column, func) in measures.items():
+        if func == 'mean':
+            partials[f'{column} sum'] = (column, 'sum')
+            partials[f'{column} count'] = (column, 'count')
+        elif func in MERGE:
+            partials[f'{column} {func}'] = (column, func)
+        else:
+            return None
+    return partials
+
+def _partial(part, keys, partials) -> pd.DataFrame:
+    return part.groupby(keys, observed=True).agg(**partials).reset_index()
+
+def grouped(data: pd.DataFrame, keys, measures) -> pd.DataFrame:
+    # Same as data.groupby(keys, observed=True).agg(**measures).reset_index()
+    partials = plan_partials(measures)
+    n_parts = min(WORKERS, len(data) // MIN_PARTITION_ROWS)
+    if partials is None or n_parts < 2:
+        return data.groupby(keys, observed=True).agg(**measures).reset_index()
+
+    bounds = np.linspace(0, len(data), n_parts + 1).astype(int)
+    parts = [data.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    results = list(get_pool().map(lambda part: _partial(part, keys, partials), parts))
+
+    # Merge the partial aggregates by key
+    merged = pd.concat(results, ignore_index=True).groupby(keys, observed=True).agg(**{
+        partial: (partial, MERGE[func]) for partial, (column, func) in partials.items()
+    }).reset_index()
+
+    result = merged[keys].copy()
+    for name, (column, func) in measures.items():
+        if func == 'mean':
+            result[name] = merged[f'{column} sum'] / merged[f'{column} count']
+        else:
+            result[name] = merged[f'{column} {func}']
+    return result
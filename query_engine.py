@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+import case_cube
+import fused_aggregation
+import parallel
+import sql_engine
+from bitmap_index import INDEXED_COLUMNS, build_index, select_rows, selects_all
+from data_loader import drop_unused_categories
+from date_index import build_date_index, date_bounds, date_rows
+from result_cache import cached_result, frame_resource, get_frame_resources
+
+# A filter spec describes a sidebar selection independently of how it is evaluated:
+#   dates    (column, start, end), both ends inclusive, or None
+#   include  {column: values to keep}
+#   exclude  {column: values to drop}
+def make_spec(date_column, date_range, include, exclude=None):
+    return {
+        'dates': (date_column, pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])) if date_column else None,
+        'include': {column: list(values) for column, values in include.items()},
+        'exclude': {column: list(values) for column, values in (exclude or {}).items()},
+    }
+
+def get_bitmap_index(data):
+    # Built once per loaded frame
+    return frame_resource(data, 'bitmap index', lambda: build_index(data))
+
+def get_date_index(data, column):
+    # None when the column holds no timestamps, the date filter then scans it.
+    # Such columns are listed in the sidebar.
+    index = frame_resource(data, ('date index', column), lambda: build_date_index(data[column]))
+    if index is None:
+        resources = get_frame_resources()
+        with resources['lock']:
+            resources['unindexed'].add(column)
+    return index
+
+def _sorted_values(values):
+    return tuple(sorted(set(values), key=repr))
+
+def normalize_spec(data, spec):
+    # Equal selections give equal keys whichever page built them: values are
+    # sorted and selections that keep every row of an indexed column are dropped
+    index = None if sql_engine.is_source(data) else get_bitmap_index(data)
+    include = tuple(sorted(
+        (column, _sorted_values(values)) for column, values in spec['include'].items()
+        if not (index and column in index['columns'] and selects_all(index, column, values))
+    ))
+    exclude = tuple(sorted(
+        (column, _sorted_values(values)) for column, values in spec['exclude'].items() if len(values)
+    ))
+    return spec.get('dates'), include, exclude
+
+def apply_filters(data, spec) -> pd.DataFrame:
+    # Filtered frames are shared through the result cache across pages and sessions
+    return cached_result(data, normalize_spec(data, spec), lambda: filter_frame(data, spec))
+
+def filter_frame(data, spec) -> pd.DataFrame:
+    # The date range of a frame sorted by that date is a contiguous slice found by
+    # binary search. Selections on indexed columns are answered with bitwise
+    # AND/OR on the bitmap index of the shared frame. The remaining conditions
+    # only scan the rows that are left.
+    dates = spec.get('dates')
+    lo, hi = 0, len(data)
+    # Sorted row positions in the date range when it is not the rows [lo, hi)
+    in_range = None
+    if dates:
+        column, start, end = dates
+        date_index = get_date_index(data, column)
+        if date_index is not None:
+            lo, hi = date_bounds(date_index, start, end)
+            in_range = date_rows(date_index, lo, hi)
+            dates = None
+
+    indexed = {column: values for column, values in spec['include'].items() if column in INDEXED_COLUMNS}
+    rows = select_rows(get_bitmap_index(data), indexed) if indexed else None
+
+    if rows is None and in_range is None:
+        data = data.iloc[lo:hi]
+    elif rows is None:
+        data = data.take(in_range)
+    elif in_range is None:
+        data = data.take(rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)])
+    else:
+        data = data.take(np.intersect1d(rows, in_range, assume_unique=True))
+
+    conditions = []
+    if dates:
+        column, start, end = dates
+        conditions.append((data[column] >= start) & (data[column] <= end))
+
+    for column, values in spec['include'].items():
+        if column not in indexed:
+            conditions.append(data[column].isin(values))
+
+    for column, values in spec['exclude'].items():
+        conditions.append(~data[column].isin(values))
+
+    # Without further conditions the date slice is returned as is
+    if not conditions:
+        return data
+
+    mask = conditions[0]
+    for condition in conditions[1:]:
+        mask &= condition
+    return data[mask]
+
+def select_cases(data, spec):
+    # With pandas this is the filtered frame. With the SQL engine nothing is
+    # materialised, the spec is pushed down into every aggregate query instead.
+    if sql_engine.is_source(data):
+        return sql_engine.select(data, spec)
+    return apply_filters(data, spec)
+
+def select_columns(data, spec, columns) -> pd.DataFrame:
+    # For pages that need individual cases, with at least the given columns.
+    # With the SQL engine only those columns of the matching cases are read.
+    if sql_engine.is_source(data):
+        key = ('rows', tuple(columns)) + normalize_spec(data, spec)
+        return cached_result(data, key, lambda: sql_engine.fetch(data, spec, columns))
+    return apply_filters(data, spec)
+
+def get_cube(data):
+    # Built once per loaded frame, unless one was handed over by use_cube
+    return frame_resource(data, 'case cube', lambda: case_cube.build_cube(data))
+
+def use_cube(data, cube):
+    # Registers an already built cube of data, e.g. the one the case store keeps
+    return frame_resource(data, 'case cube', lambda: cube)
+
+def select_summary(data, spec):
+    # For pages that only need case counts and minute sums. With pandas these are
+    # the matching cells of the case cube, which is much smaller than the case
+    # table. Specs on columns the cube does not have fall back to select_cases.
+    if sql_engine.is_source(data) or not case_cube.covers(spec):
+        return select_cases(data, spec)
+    return {'cube': apply_filters(get_cube(data), spec)}
+
+def aggregate(cases, keys, measures) -> pd.DataFrame:
+    # measures use the pandas named aggregation form {name: (column, func)}.
+    # The result always has the keys as columns, sorted by key.
+    if isinstance(cases, dict) and 'cube' in cases:
+        result = case_cube.rollup(cases['cube'], keys, measures)
+    elif not isinstance(cases, pd.DataFrame):
+        result = sql_engine.aggregate(cases, keys, measures)
+    elif keys:
+        result = parallel.grouped(cases, keys, measures)
+    else:
+        result = pd.DataFrame({
+            name: [len(cases) if func == 'size' else cases[column].agg(func)]
+            for name, (column, func) in measures.items()
+        })
+
+    return drop_unused_categories(result)
+
+def aggregate_many(cases, requests):
+    # requests {name: (keys, measures)} for one page, answered together.
+    # Returns {name: same frame as aggregate(cases, keys, measures)}. With pandas,
+    # sizes, sums, counts and means share one encoding of each key and one pass
+    # over the rows per root grain; coarser requests are rolled up from it.
+    results = {}
+    if isinstance(cases, pd.DataFrame):
+        results = {
+            name: drop_unused_categories(result)
+            for name, result in fused_aggregation.aggregate_many(cases, requests).items()
+        }
+
+    return {
+        name: results[name] if name in results else aggregate(cases, keys, measures)
+        for name, (keys, measures) in requests.items()
+    }
@@ -0,0 +1,137 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Filtered frames shared by every page and session, least recently used
+# results are evicted once their total size exceeds the budget. The budget
+# counts the fixed width buffers a result holds on its own: 8 bytes per value
+# of an object column (not the strings it points to, which are shared with the
+# loaded frame), the codes of categoricals, and nothing for columns that are
+# views of the source frame, like those of a date slice.
+RESULT_CACHE_MB = int(os.environ.get('DASHBOARD_RESULT_CACHE_MB', '256'))
+
+@st.cache_resource
+def get_result_cache():
+    return {
+        'lock': threading.Lock(),
+        'entries': OrderedDict(),
+        'bytes': 0,
+        'limit': RESULT_CACHE_MB * 1024 * 1024,
+        'hits': 0,
+        'misses': 0,
+        'evictions': 0,
+    }
+
+def frame_bytes(frame, source=None) -> int:
+    # Constant work per column, whatever the number of rows
+    usage = frame.memory_usage(index=True, deep=False)
+    if isinstance(source, pd.DataFrame):
+        for column in frame.columns:
+            if column in source.columns and not isinstance(frame[column].dtype, pd.CategoricalDtype) \
+                    and np.may_share_memory(frame[column].to_numpy(), source[column].to_numpy()):
+                usage[column] = 0
+    return int(usage.sum())
+
+def _evict_dead(cache) -> None:
+    # Results of a source frame that has been freed (a reloaded dataset) can never
+    # be hit again, drop them so they do not keep the old data alive
+    for key in [key for key, entry in cache['entries'].items() if entry['source']() is None]:
+        cache['bytes'] -= cache['entries'].pop(key)['bytes']
+        cache['evictions'] += 1
+
+def cached_result(source, key, compute):
+    # Results are keyed on the source frame and a normalized spec. The entry
+    # keeps a weak reference to its source, so a reloaded dataset that happens
+    # to get the same id never sees results of the old one.
+    cache = get_result_cache()
+    key = (id(source), key)
+
+    with cache['lock']:
+        _evict_dead(cache)
+        entry = cache['entries'].get(key)
+        if entry is not None and entry['source']() is source:
+            cache['entries'].move_to_end(key)
+            cache['hits'] += 1
+            return entry['result']
+        cache['misses'] += 1
+
+    # Computed outside the lock, concurrent misses on the same key both compute
+    result = compute()
+    size = frame_bytes(result, source)
+
+    with cache['lock']:
+        _evict_dead(cache)
+        old = cache['entries'].pop(key, None)
+        if old is not None:
+            cache['bytes'] -= old['bytes']
+        if size <= cache['limit']:
+            cache['entries'][key] = {'source': weakref.ref(source), 'result': result, 'bytes': size}
+            cache['bytes'] += size
+        while cache['bytes'] > cache['limit']:
+            _, evicted = cache['entries'].popitem(last=False)
+            cache['bytes'] -= evicted['bytes']
+            cache['evictions'] += 1
+    return result
+
+def result_cache_stats():
+    cache = get_result_cache()
+    with cache['lock']:
+        _evict_dead(cache)
+        lookups = cache['hits'] + cache['misses']
+        return {
+            'entries': len(cache['entries']),
+            'size_mb': cache['bytes'] / (1024 * 1024),
+            'limit_mb': cache['limit'] / (1024 * 1024),
+            'hits': cache['hits'],
+            'misses': cache['misses'],
+            'hit_rate': cache['hits'] / lookups if lookups else 0.0,
+            'evictions': cache['evictions'],
+        }
+
+@st.cache_resource
+def get_frame_resources():
+    # unindexed: date columns filtered without a date index
+    return {'lock': threading.Lock(), 'entries': {}, 'building': {}, 'unindexed': set()}
+
+def frame_resource(source, name, build):
+    # Structures built once per loaded frame (indexes, facets, the case cube) and
+    # shared by every session. Like the results above they are keyed on the
+    # frame's id and checked against a weak reference, so a new frame that gets
+    # the id of a freed one is never handed the old frame's structures. build()
+    # must not keep a reference to the frame itself or it is never freed.
+    resources = get_frame_resources()
+    key = (id(source), name)
+
+    def lookup():
+        for stale in [other for other, entry in resources['entries'].items() if entry['source']() is None]:
+            del resources['entries'][stale]
+        entry = resources['entries'].get(key)
+        return entry if entry is not None and entry['source']() is source else None
+
+    with resources['lock']:
+        entry = lookup()
+        if entry is not None:
+            return entry['value']
+        building = resources['building'].setdefault(key, threading.Lock())
+
+    # One session builds while the others wait for it instead of building too
+    with building:
+        with resources['lock']:
+            entry = lookup()
+        if entry is not None:
+            return entry['value']
+        value = build()
+        with resources['lock']:
+            resources['entries'][key] = {'source': weakref.ref(source), 'value': value}
+            resources['building'].pop(key, None)
+        return value
+
+def unindexed_date_columns():
+    resources = get_frame_resources()
+    with resources['lock']:
+        return sorted(resources['unindexed'])
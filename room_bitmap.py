@@ -0,0 +1,79 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import sql_engine
+from ontario_calendar import working_day_mask
+from result_cache import frame_resource
+
+# Room x day x minute-of-day occupancy, one bit per minute packed along the
+# day (180 bytes per room and day). Built once from the enter and exit times
+# of the whole table; date ranges and room selections slice the packed array.
+MINUTES_PER_DAY = 24 * 60
+BITMAP_COLUMNS = ['Roomdescription', 'RoomEnterDateTime', 'RoomExitDateTime']
+
+def build_room_bitmap(cases: pd.DataFrame):
+    enter, exit = cases['RoomEnterDateTime'], cases['RoomExitDateTime']
+    valid = (cases['Roomdescription'].notna() & enter.notna() & exit.notna() & (enter < exit)).to_numpy()
+    enter, exit = enter[valid], exit[valid]
+    room_codes, rooms = pd.factorize(cases['Roomdescription'][valid], sort=True)
+
+    if len(room_codes) == 0:
+        return {'rooms': rooms, 'days': pd.DatetimeIndex([]), 'bits': np.zeros((len(rooms), 0, MINUTES_PER_DAY // 8), dtype=np.uint8)}
+
+    first_day = enter.min().normalize()
+    days = pd.date_range(first_day, exit.max().normalize(), freq='D')
+    length = len(days) * MINUTES_PER_DAY
+    starts = ((enter - first_day).to_numpy() // np.timedelta64(1, 'm')).astype(np.int64)
+    # A case occupies every minute it takes up at least part of
+    ends = np.minimum(-((first_day - exit).to_numpy() // np.timedelta64(1, 'm')).astype(np.int64), length)
+
+    # Per room, +1 where a case starts and -1 where it ends, the running sum is
+    # the number of cases in the room at each minute of the timeline
+    bits = np.empty((len(rooms), len(days), MINUTES_PER_DAY // 8), dtype=np.uint8)
+    for room in range(len(rooms)):
+        in_room = room_codes == room
+        steps = np.bincount(starts[in_room], minlength=length + 1) - np.bincount(ends[in_room], minlength=length + 1)
+        occupied = np.cumsum(steps[:length]) > 0
+        bits[room] = np.packbits(occupied.reshape(len(days), MINUTES_PER_DAY), axis=1)
+    return {'rooms': rooms, 'days': days, 'bits': bits}
+
+def get_room_bitmap(data):
+    # Built once per loaded frame. The SQL engine only reads the columns it needs.
+    if sql_engine.is_source(data):
+        return frame_resource(data, 'room bitmap', lambda: build_room_bitmap(sql_engine.fetch(data, None, BITMAP_COLUMNS)))
+    return frame_resource(data, 'room bitmap', lambda: build_room_bitmap(data))
+
+def hourly_occupancy(bitmap, rooms, start_date, end_date, remove_weekends=False, remove_holidays=False) -> pd.DataFrame:
+    # Share of room-days in the selection with the room occupied, per weekday
+    # and hour of the day. Days without cases count as empty rooms.
+    lo = bitmap['days'].searchsorted(pd.to_datetime(start_date), 'left')
+    hi = bitmap['days'].searchsorted(pd.to_datetime(end_date), 'right')
+    days = bitmap['days'][lo:hi]
+    keep = np.flatnonzero(working_day_mask(days, remove_weekends, remove_holidays))
+    weekdays = days.dayofweek.to_numpy()[keep]
+
+    room_rows = bitmap['rooms'].get_indexer(list(rooms))
+    room_rows = room_rows[room_rows >= 0]
+
+    # Unpacked one room at a time, so memory stays at one room's days
+    minutes = np.zeros((7, 24))
+    for room in room_rows:
+        occupied = np.unpackbits(bitmap['bits'][room, lo:hi][keep], axis=1)
+        hours = occupied.reshape(len(keep), 24, 60).sum(axis=2)
+        np.add.at(minutes, weekdays, hours)
+
+    room_days = np.bincount(weekdays, minlength=7) * len(room_rows)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = minutes / (room_days[:, None] * 60)
+    return pd.DataFrame(share, index=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], columns=range(24))
+
+def occupancy_heatmap(share: pd.DataFrame, title):
+    fig, ax = plt.subplots(figsize=(12, 4))
+    image = ax.imshow(share.to_numpy() * 100, aspect='auto', cmap='Blues', vmin=0, vmax=100)
+    ax.set_xticks(range(len(share.columns)), share.columns)
+    ax.set_yticks(range(len(share.index)), share.index)
+    ax.set_title(title)
+    ax.set_xlabel('Hour of Day')
+    fig.colorbar(image, ax=ax, label='Occupied (%)')
+    return fig
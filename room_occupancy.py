@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# Actual room occupancy from room enter and exit times. Cases are grouped by
+# room and the day they entered the room, and overlapping cases in a group are
+# merged so a room is never counted as occupied twice. Every group is merged in
+# one sort and one running maximum over all rows.
+
+def merge_intervals(groups, starts, ends):
+    # groups, starts and ends are integer arrays, starts and ends in minutes
+    # from the start of the group's day. Returns (group, start, end) arrays of
+    # the merged intervals, sorted by group and start.
+    order = np.lexsort((starts, groups))
+    groups, starts, ends = groups[order], starts[order], ends[order]
+    if len(groups) == 0:
+        return groups, starts, ends
+
+    # Offsetting each group past the ends of the previous ones lets a single
+    # running maximum of the ends stay within its group
+    span = int(ends.max()) + 1
+    offset = (groups - groups[0]) * span
+    reach = np.maximum.accumulate(ends + offset) - offset
+
+    # An interval starts a new merged interval when it starts after everything
+    # before it in its group has ended, or when it is the first of its group
+    first = np.ones(len(groups), dtype=bool)
+    first[1:] = (groups[1:] != groups[:-1]) | (starts[1:] > reach[:-1])
+    runs = np.flatnonzero(first)
+    return groups[runs], starts[runs], np.maximum.reduceat(reach, runs)
+
+def daily_room_occupancy(cases: pd.DataFrame, block_start=8 * 60, block_end=16 * 60) -> pd.DataFrame:
+    # Minutes per room and day: occupied by at least one case, occupied within
+    # the block window [block_start, block_end) (minutes after midnight),
+    # overtime outside it (before the block starts or after it ends), and idle
+    # gaps between the first case in and the last case out. Block and overtime
+    # minutes add up to the occupied minutes.
+    enter, exit = cases['RoomEnterDateTime'], cases['RoomExitDateTime']
+    valid = (cases['Roomdescription'].notna() & enter.notna() & exit.notna() & (enter < exit)).to_numpy()
+    enter, exit = enter[valid], exit[valid]
+    rooms = cases['Roomdescription'][valid]
+
+    day = enter.dt.normalize()
+    starts = ((enter - day).to_numpy() // np.timedelta64(1, 'm')).astype(np.int64)
+    ends = ((exit - day).to_numpy() // np.timedelta64(1, 'm')).astype(np.int64)
+    grouping = pd.DataFrame({'Roomdescription': rooms, 'Date': day}).groupby(['Roomdescription', 'Date'], observed=True)
+    groups = grouping.ngroup().to_numpy(dtype=np.int64)
+    keys = grouping.size().index
+    size = len(keys)
+
+    group, start, end = merge_intervals(groups, starts, ends)
+    in_block = np.clip(np.minimum(end, block_end) - np.maximum(start, block_start), 0, None)
+    overtime = (end - start) - in_block
+
+    # Merged intervals are sorted by group and do not overlap, every group has
+    # at least one of them
+    minutes = lambda weights: np.bincount(group, weights=weights, minlength=size).astype(np.int64)
+    occupied = minutes(end - start)
+    changes = group[1:] != group[:-1]
+    first_in = start[np.flatnonzero(np.append(True, changes))[:size]]
+    last_out = end[np.flatnonzero(np.append(changes, True))[:size]]
+
+    return pd.DataFrame({
+        'Roomdescription': keys.get_level_values(0),
+        'Date': keys.get_level_values(1),
+        'cases': np.bincount(groups, minlength=size),
+        'occupied_minutes': occupied,
+        'block_minutes': minutes(in_block),
+        'overtime_minutes': minutes(overtime),
+        'idle_minutes': (last_out - first_in) - occupied,
+    })
@@ -0,0 +1,142 @@
+import os
+
+import pandas as pd
+
+import case_store
+import data_loader
+
+# Set DASHBOARD_ENGINE=duckdb to run page filters and aggregations in an embedded
+# DuckDB database instead of pandas. Falls back to pandas when duckdb is missing.
+ENGINE = os.environ.get('DASHBOARD_ENGINE', 'pandas')
+
+duckdb = None
+if ENGINE == 'duckdb':
+    try:
+        import duckdb
+    except ImportError:
+        duckdb = None
+
+# pandas aggregation names and their SQL equivalent
+MEASURE_SQL = {
+    'size': 'COUNT(*)',
+    'count': 'COUNT({})',
+    'sum': 'SUM({})',
+    'mean': 'AVG({})',
+    'min': 'MIN({})',
+    'max': 'MAX({})',
+    'nunique': 'COUNT(DISTINCT {})',
+}
+
+def sql_enabled() -> bool:
+    return ENGINE == 'duckdb' and duckdb is not None
+
+def quote(column) -> str:
+    # Several columns have spaces in their names ('Surgery Year')
+    return '"' + column.replace('"', '""') + '"'
+
+class CaseSource(dict):
+    # The cases as DuckDB sees them, {'connection', 'tables'}. A dict subclass
+    # only so indexes and results can be keyed on it like on a loaded frame,
+    # plain dicts take no weak references.
+    pass
+
+def is_source(data) -> bool:
+    return isinstance(data, CaseSource)
+
+def open_source(tables) -> CaseSource:
+    # tables are memory mapped Arrow tables or pandas frames. DuckDB scans them
+    # in place through the 'cases' view, nothing is copied into the database.
+    connection = duckdb.connect()
+    for i, table in enumerate(tables):
+        connection.register(f'part_{i}', table)
+    # Store parts written at different times may differ in column types
+    connection.execute('CREATE VIEW cases AS ' + ' UNION ALL BY NAME '.join(
+        f'SELECT * FROM part_{i}' for i in range(len(tables))
+    ))
+    return CaseSource(connection=connection, tables=tables)
+
+def open_cases(path, version=None) -> CaseSource:
+    # The case store when there is one, otherwise the snapshot of the extract.
+    # Falls back to the loaded frame when the files cannot be read as they are.
+    if version is not None:
+        tables = case_store.read_store_tables(case_store.CASE_STORE_DIR)
+        return open_source(tables or [case_store.read_store(case_store.CASE_STORE_DIR)])
+    return open_source([data_loader.case_table(path)])
+
+def cursor(source):
+    # A cursor is an independent connection to the same database, so concurrent
+    # sessions can query at the same time. Registered tables are per connection.
+    cursor = source['connection'].cursor()
+    for i, table in enumerate(source['tables']):
+        cursor.register(f'part_{i}', table)
+    return cursor
+
+def columns(source):
+    return cursor(source).execute('SELECT * FROM cases LIMIT 0').df().columns.tolist()
+
+def where_clause(spec):
+    conditions = []
+    params = []
+
+    if spec.get('dates'):
+        column, start, end = spec['dates']
+        conditions.append(f'{quote(column)} BETWEEN ? AND ?')
+        params += [start, end]
+
+    for column, values in spec['include'].items():
+        if len(values) == 0:
+            # Same as isin([]) in pandas, nothing matches
+            conditions.append('FALSE')
+            continue
+        conditions.append(f"{quote(column)} IN ({', '.join(['?'] * len(values))})")
+        params += list(values)
+
+    for column, values in spec['exclude'].items():
+        if len(values) == 0:
+            continue
+        conditions.append(f"{quote(column)} NOT IN ({', '.join(['?'] * len(values))})")
+        params += list(values)
+
+    return ' AND '.join(conditions) or 'TRUE', params
+
+def select(source, spec):
+    # Nothing is materialised here, the spec is pushed down into every query
+    return {'source': source, 'spec': spec}
+
+def fetch(source, spec, columns) -> pd.DataFrame:
+    # Only the given columns of the matching cases, every case without a spec
+    where, params = where_clause(spec) if spec else ('TRUE', [])
+    sql = f"SELECT {', '.join(quote(column) for column in columns)} FROM cases WHERE {where}"
+    return cursor(source).execute(sql, params).df()
+
+def facet_frame(source, facet_columns, date_columns, flag=None) -> pd.DataFrame:
+    # Every distinct combination of the facet columns, once with the earliest
+    # and once with the latest dates seen with it. The facets built from these
+    # rows are those of the whole table, from a result a fraction of its size.
+    available = columns(source)
+    keys = ', '.join(quote(column) for column in facet_columns if column in available)
+    dates = [column for column in date_columns if column in available]
+    where = quote(flag) if flag else 'TRUE'
+    sql = ' UNION ALL '.join(
+        f"SELECT {', '.join([keys] + [f'{bound}({quote(column)}) AS {quote(column)}' for column in dates])} "
+        f"FROM cases WHERE {where} GROUP BY {keys}"
+        for bound in ('MIN', 'MAX')
+    )
+    return cursor(source).execute(sql).df()
+
+def aggregate(query, keys, measures):
+    where, params = where_clause(query['spec'])
+
+    select_list = [quote(key) for key in keys] + [
+        f'{MEASURE_SQL[func].format(quote(column))} AS {quote(name)}'
+        for name, (column, func) in measures.items()
+    ]
+    sql = f"SELECT {', '.join(select_list)} FROM cases WHERE {where}"
+
+    if keys:
+        # pandas drops missing keys when grouping, do the same here
+        sql += ''.join(f' AND {quote(key)} IS NOT NULL' for key in keys)
+        key_list = ', '.join(quote(key) for key in keys)
+        sql += f' GROUP BY {key_list} ORDER BY {key_list}'
+
+    return cursor(query['source']).execute(sql, params).df()
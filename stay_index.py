@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from census import stamps
+from result_cache import frame_resource
+
+# PACU stays sorted by start time, with the running maximum of their end times.
+# The running maximum never decreases, so no stay before the first one whose
+# running maximum reaches a is still in PACU at a, and no stay after the last
+# start at or before b has begun by b. Two binary searches bound the stays
+# overlapping a window [a, b], only those candidates are checked.
+
+def build_stay_index(starts, ends):
+    starts, ends = pd.Series(starts), pd.Series(ends)
+    # Same stays as the census: both times known and not ending before they start
+    valid = (starts.notna() & ends.notna() & (starts <= ends)).to_numpy()
+    rows = np.flatnonzero(valid)
+    starts = stamps(starts[valid])
+    ends = stamps(ends[valid])
+
+    order = np.argsort(starts, kind='stable')
+    ends = ends[order]
+    return {
+        'rows': rows[order],
+        'starts': starts[order],
+        'ends': ends,
+        'reach': np.maximum.accumulate(ends),
+    }
+
+def get_stay_index(data):
+    # Built once per loaded frame
+    return frame_resource(data, 'stay index', lambda: build_stay_index(data['PacuStartdatetime'], data['PacuEnddatetime']))
+
+def overlapping(index, start, end) -> np.ndarray:
+    # Row positions of the stays in PACU at any time in [start, end], both ends
+    # included, in order of the frame
+    start, end = stamps([start, end])
+    first = np.searchsorted(index['reach'], start, 'left')
+    last = np.searchsorted(index['starts'], end, 'right')
+    candidates = slice(first, max(first, last))
+    return np.sort(index['rows'][candidates][index['ends'][candidates] >= start])
+
+def present_at(index, time) -> np.ndarray:
+    # Row positions of the stays in PACU at time
+    return overlapping(index, time, time)